@@ -0,0 +1,80 @@
+'''
+Memory per segment of WER and POWER alignments kept in memory, as ExpandedAlignments and as CompactAlignments
+sharing one Vocabulary.
+
+The corpus is aligned once. The alignments are then loaded from JSON --repeat times, so every copy has its own
+strings, as segments read from a large run would.
+
+    python benchmarks/alignment_memory.py --ref examples/align-words/ref.txt --hyp examples/align-words/hyp.txt \\
+        --lexicon lex/cmudict.rep.json --repeat 200
+'''
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from power.aligner import PowerAligner
+from power.levenshtein import ExpandedAlignment, Vocabulary
+
+
+def load(dumps, repeat, vocabulary=None):
+    '''
+    Loads repeat copies of the alignments in dumps, compacted in vocabulary if given.
+    Returns (alignments, bytes held, seconds).
+    '''
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    alignments = []
+    for _ in range(repeat):
+        for dump in dumps:
+            alignment = ExpandedAlignment.from_dict(json.loads(dump))
+            if vocabulary is not None:
+                alignment = alignment.compact(vocabulary)
+            alignments.append(alignment)
+    elapsed = time.time() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return alignments, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ref', required=True, help="Reference file, one segment per line.")
+    parser.add_argument('--hyp', required=True, help="Hypothesis file, one segment per line.")
+    parser.add_argument('--lexicon', required=True, help="Pronunciation lexicon.")
+    parser.add_argument('--repeat', type=int, default=100, help="Copies of the corpus to keep in memory.")
+    parser.add_argument('--lowercase', action='store_true', help="Lowercase the segments.")
+    args = parser.parse_args()
+
+    with open(args.ref) as f_ref, open(args.hyp) as f_hyp:
+        pairs = list(zip(f_ref, f_hyp))
+    results = [result for result in PowerAligner.align_batch(pairs, lowercase=args.lowercase, lexicon=args.lexicon,
+                                                             alignments=True)
+               if result is not None]
+
+    print("Segments: {0:d} x {1:d}".format(len(results), args.repeat))
+    for name in ('wer_alignment', 'power_alignment'):
+        dumps = [json.dumps(getattr(result, name).to_dict()) for result in results]
+        expanded, expanded_size, expanded_time = load(dumps, args.repeat)
+        vocabulary = Vocabulary()
+        compact, compact_size, compact_time = load(dumps, args.repeat, vocabulary)
+        assert all(x.error_rate() == y.error_rate() for x, y in zip(expanded, compact))
+
+        count = len(expanded)
+        print("{0}: {1:.0f} bytes/segment expanded, {2:.0f} bytes/segment compact ({3:.1%}), "
+              "{4:d} vocabulary entries; load time {5:.2f}s vs {6:.2f}s".format(
+                  name, expanded_size / count, compact_size / count, compact_size / expanded_size,
+                  len(vocabulary), expanded_time, compact_time))
+        del expanded, compact
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''
+Import time of the command-line tools, from `python -X importtime`: the time spent importing the modules of this
+repository (and in total) before `--help` is printed, as the median of several runs.
+
+    python benchmarks/import_time.py --runs 20
+'''
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(script):
+    '''(module, self_us) pairs of one `python -X importtime script --help` run.'''
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', script, '--help'], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                            check=True).stderr
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(self_us)))
+    return times
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10, help="Runs per script.")
+    parser.add_argument('scripts', nargs='*', default=['power.py', 'lev.py'], help="Scripts to time.")
+    args = parser.parse_args()
+
+    for script in args.scripts:
+        ours = []
+        total = []
+        for _ in range(args.runs):
+            times = import_times(script)
+            ours.append(sum(self_us for name, self_us in times if name.split('.')[0] == 'power'))
+            total.append(sum(self_us for _, self_us in times))
+        print("{0} --help: {1:d} us in power modules, {2:d} us in all imports (median of {3:d} runs)".format(
+            script, median(ours), median(total), args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,12 @@ from power import Levenshtein, ExpandedAlignment
 def main(argv):
 	parser = argparse.ArgumentParser(description='''Align two sequences of tokens.''')
 	parser.add_argument('-c', '--compact', action='store_true', default=False, help="Make the alignment compact")
+	parser.add_argument('-s', '--scores', action='store_true', default=False,
+						help="Only print the error rate and the C/S/D/I counts of each segment, without aligning the strings")
+	parser.add_argument('-a', '--anchored', action='store_true', default=False,
+						help="Split long alignments on tokens that occur once in both sequences (faster, but may miss the optimal alignment)")
+	parser.add_argument('--validate', action='store_true', default=False,
+						help="With --anchored, also compute the full alignment cost and report any difference")
 	parser.add_argument('ref', help='Reference file')
 	parser.add_argument('hyp', help='Hypothesis file')
 
@@ -15,7 +21,21 @@ def main(argv):
 		for ref, hyp in zip(fref, fhyp):
 			ref = [x for x in ref.strip().split(' ') if x]
 			hyp = [x for x in hyp.strip().split(' ') if x]
-			
+
+			if args.scores:
+				error_rate, score_components = Levenshtein.alignCounts(ref, hyp)
+				print('Scores (#C #S #D #I) {0} {1} {2} {3}\tErrors: {4:4.1%}'.format(score_components['C'],
+					score_components['S'], score_components['D'], score_components['I'], error_rate))
+				continue
+
+			if args.anchored:
+				alignment = Levenshtein.alignAnchored(ref, hyp, validate=args.validate)
+				print(alignment)
+				if args.validate and alignment is not None and alignment.cost != alignment.full_cost:
+					print('Cost: {0} (full alignment: {1})'.format(alignment.cost, alignment.full_cost))
+				print('')
+				continue
+
 			lev = Levenshtein.align(ref, hyp) #, reserve_list=PowerAligner.reserve_list, exclusive_sets=PowerAligner.exclusive_sets)
 			lev.editops()
 			alignment = lev.expandAlign() if not args.compact else lev.expandAlignCompact()
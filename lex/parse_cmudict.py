@@ -4,10 +4,15 @@ Without syllables: http://svn.code.sf.net/p/cmusphinx/code/trunk/cmudict/cmudict
 With syllables (98% accuracy): http://webdocs.cs.ualberta.ca/~kondrak/cmudict/cmudict.rep
 '''
 
+import os
 import re
+import sys
 import json
 import string
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from power.lexicon import compile_lexicon
+
 dictversion = 'cmudict.rep'
 with open(dictversion, 'r') as f:
     lex = {}
@@ -26,4 +31,7 @@ with open(dictversion, 'r') as f:
                 continue
             lex[word] = phonemes
 with open(dictversion+".json", 'w') as fout:
-    json.dump(lex, fout, sort_keys=True)
\ No newline at end of file
+    json.dump(lex, fout, sort_keys=True)
+
+# Compiled, memory-mappable copy of the same lexicon
+compile_lexicon(lex, dictversion+".bin")
@@ -2,22 +2,25 @@ from __future__ import division
 import sys
 import argparse
 import copy
-from collections import defaultdict, Counter
+import os
 
 from power import writers
-from power.aligner import PowerAligner
 
 
 def main(argv):
     parser = argparse.ArgumentParser("power.py")
     parser.add_argument('--ref', dest='reffile', required=True,
                         help="Define the reference file")
-    parser.add_argument('--hyp', dest='hypfile', required=True,
-                        help="Define the hypothesis file")
+    hyp_group = parser.add_mutually_exclusive_group(required=True)
+    hyp_group.add_argument('--hyp', dest='hypfiles', nargs='+',
+                           help="Define the hypothesis file (or the files of several systems, scored in one pass)")
+    hyp_group.add_argument('--nbest', dest='nbest', default=None,
+                           help="Score the oracle of each segment's n-best list (Moses format: id ||| hypothesis ||| ...)")
     parser.add_argument('-v', '--verbose', dest='verbose',
                         action='store_true', help="Verbose output", default=False)
     parser.add_argument('-o', '--output', dest='output',
-                        help="Output file prefix", required=True)
+                        help="Output file prefix (with several hypothesis files, followed by the name of each system)",
+                        required=True)
     parser.add_argument('-f', '--format', dest='format', nargs='+', help="Output formats",
                         choices=['sgml', 'snt', 'json', 'align'], default=['snt'])
     parser.add_argument('--print-wer', dest='print_wer', action='store_true',
@@ -32,168 +35,315 @@ def main(argv):
                         help="Perform case-sensitive alignment", default=True)
     parser.add_argument('--word-align-weights', dest="word_align_weights", required=False, nargs=4, type=int,
                         help='Weights for the Levenshtein word aligner (C S D I)')
+    parser.add_argument('--engine', dest="engine", choices=['python', 'numpy'], default='python',
+                        help="Dynamic programming engine for the Levenshtein aligner")
+    parser.add_argument('--word-align-mode', dest="word_align_mode", choices=['full', 'banded', 'linear', 'anchored'], default='full',
+                        help="Fill the full word alignment matrix, only a band around the diagonal (faster on long, similar segments), "
+                             "align in linear space (for document-length segments), or split on words that occur once in both "
+                             "ref and hyp (much faster on long documents, but may miss the optimal word alignment)")
+    parser.add_argument('--oracle-candidates', dest="oracle_candidates", type=int, default=0,
+                        help="Align at most this many n-best entries in full to find the POWER oracle, in order of their "
+                             "lower bound of errors. Faster, but the oracle is approximate (default 0: as many as the "
+                             "exact oracle needs)")
+    parser.add_argument('-j', '--jobs', dest="jobs", type=int, default=1,
+                        help="Number of processes scoring segments in parallel (0: one per CPU)")
+    parser.add_argument('--oov-cache', dest="oov_cache", default=None,
+                        help="sqlite file storing fallback pronunciations of out-of-lexicon words across runs")
+    parser.add_argument('--result-cache', dest="result_cache", default=None,
+                        help="sqlite file storing segment results across runs, keyed by segment, weights and lexicon")
+    parser.add_argument('--previous', dest="previous", default=None, metavar='PREFIX',
+                        help="Output prefix of an earlier run (with -f json --print-wer) whose results are reused for "
+                             "unchanged segments, if it was scored with the same options")
+    parser.add_argument('--previous-hyp', dest="previous_hyp", default=None,
+                        help="Hypothesis file of the earlier run (default: --hyp)")
+    parser.add_argument('--previous-ref', dest="previous_ref", default=None,
+                        help="Reference file of the earlier run (default: --ref)")
     parser.add_argument('--lexicon', dest="lexicon", default=None, required=True, 
-                        help="Path to pronunciation lexicon (json key/value dict)")
+                        help="Path to pronunciation lexicon (json key/value dict or compiled lexicon)")
 
     #parser.set_defaults(verbose=False, format=['sgml'], print_wer=False, compare_wer=False, show_phonemes=False)
 
     args = parser.parse_args(argv)
+    if args.nbest:
+        args.hypfiles = [args.nbest]
+    if args.previous and (len(args.hypfiles) > 1 or args.nbest):
+        parser.error("--previous can't be used with several hypothesis files or --nbest")
+    if args.previous and args.show_phonemes:
+        parser.error("--previous can't be used with --show-phonemes: phonetic alignments aren't in the json output")
+    if args.previous and args.previous == args.output:
+        parser.error("--previous must differ from --output, which is overwritten while it is read")
 
-    wer_score_components = Counter()
-    power_score_components = Counter()
+    # Imported after parsing, so --help and argument errors don't pay for the aligner and pronouncer imports.
+    from power.pipeline import (SegmentScorer, SystemsScorer, ScoreTotals, PreviousRun, prefetch, read_segments,
+                                read_systems, score_segments)
 
-    wer_confusions = defaultdict(Counter)
-    power_confusions = defaultdict(Counter)
+    systems = [System(args, hypfile, prefix, ScoreTotals(confusions=bool(args.show_confusions),
+                                                         wer_confusions=args.print_wer))
+               for hypfile, prefix in zip(args.hypfiles, system_prefixes(args.output, args.hypfiles))]
+    multiple = len(systems) > 1
 
     if args.verbose:
         print(args)
 
-    # Open the two files for reading
-    with open(args.reffile, 'r') as f_ref, open(args.hypfile, 'r') as f_hyp:
+    # Open the reference once, and a hypothesis file per system
+    with open(args.reffile, 'r') as f_ref:
+        f_hyps = [open(system.hypfile, 'r') for system in systems]
         linecount = 0
 
-        wer_writers = []
-        power_writers = []
+        for system in systems:
+            system.open_writers(args)
 
+        keys = ['C', 'S', 'D', 'I']
+        word_align_weights = dict(zip(keys, args.word_align_weights)) if args.word_align_weights else None
+        scorer_args = dict(lowercase=args.lowercase, verbose=args.verbose, word_align_weights=word_align_weights,
+                           oov_cache=args.oov_cache, result_cache=args.result_cache, engine=args.engine,
+                           word_align_mode=args.word_align_mode)
+        if args.nbest:
+            from power.nbest import NbestScorer, read_nbest_segments
+            scorer = NbestScorer(args.lexicon, candidates=args.oracle_candidates, **scorer_args)
+            oracle = NbestReport("{}.oracle".format(args.output))
+        else:
+            scorer = (SystemsScorer if multiple else SegmentScorer)(args.lexicon, **scorer_args)
+            if 'json' in args.format and args.print_wer:
+                # Lets a later run reuse this output (see --previous)
+                options = scorer.options()
+                for system in systems:
+                    PreviousRun.write_options(system.prefix, options)
+
+        # Stream the corpus through bounded stages: read ahead -> align -> add to totals -> write.
+        # Segments come back in order, whether they are scored here or by the worker processes.
+        previous = None
+        if args.previous:
+            previous = PreviousRun(args.previous, args.previous_ref or args.reffile,
+                                   args.previous_hyp or args.hypfiles[0], lowercase=args.lowercase,
+                                   options=scorer.options())
+            if previous.reason is not None:
+                print("Not reusing {0}: {1}".format(args.previous, previous.reason))
+        if args.nbest:
+            segments = prefetch(read_nbest_segments(f_ref, f_hyps[0]))
+        elif multiple:
+            segments = prefetch(read_systems(f_ref, f_hyps))
+        else:
+            segments = prefetch(read_segments(f_ref, f_hyps[0]))
+        try:
+            for (refline, hyplines), results in score_segments(segments, scorer, jobs=args.jobs, reuse=previous):
+                linecount += 1
+                if args.nbest:
+                    oracle.write(linecount, results)
+                    hyplines = [results.nbest.power_hyp if results is not None else '']
+                if not multiple:
+                    hyplines, results = [hyplines], [results]
+
+                if args.verbose:
+                    print('===========')
+                    print('Segment {0:d}:'.format(linecount))
+                    print('===========')
+
+                for system, hypline, aligner in zip(systems, hyplines, results):
+                    if multiple and args.verbose:
+                        print('System: {0}'.format(system.name))
+                    system.write_segment(args, linecount, refline, hypline, aligner)
+        finally:
+            # Stops the reader thread if a segment fails partway through the corpus
+            segments.close()
+
+        for f_hyp in f_hyps:
+            f_hyp.close()
+
+    # Close all output files
+    for system in systems:
+        system.finalize()
+
+    if args.nbest:
+        oracle.finalize()
+    if previous:
+        previous.close()
+        print("Reused {0:d} of {1:d} segments from {2}".format(previous.reused, linecount, args.previous))
+
+    for system in systems:
+        if multiple:
+            print("System: {0} ({1})".format(system.name, system.hypfile))
+        system.report(args, linecount)
+
+    if multiple:
+        table = [system.summary(linecount) for system in systems]
+        writers.SystemsWriter.write("{}.systems.txt".format(args.output), args.reffile, table)
+        print(writers.SystemsWriter.format_table(args.reffile, table))
+
+
+def system_prefixes(output, hypfiles):
+    '''
+    Output prefix of each hypothesis file: the output prefix itself for a single file, otherwise followed by the
+    file name without its extension (or by its position, if two files have the same name).
+    '''
+    if len(hypfiles) == 1:
+        return [output]
+    names = [os.path.splitext(os.path.basename(hypfile))[0] for hypfile in hypfiles]
+    return ["{0}.{1}".format(output, name if names.count(name) == 1 else "{0}{1:d}".format(name, i + 1))
+            for i, name in enumerate(names)]
+
+
+class NbestReport(object):
+    '''
+    Writes the n-best entries chosen as the WER and POWER oracles of each segment, and counts the entries aligned in
+    full and the DP rows computed.
+    '''
+    def __init__(self, filepath):
+        self.out_file = open(filepath, 'w')
+        self.out_file.write("id\tsize\twer_rank\tpower_rank\n")
+        self.entries = 0
+        self.aligned = 0
+        self.rows = 0
+        self.words = 0
+
+    def write(self, linecount, aligner):
+        if aligner is None:
+            self.out_file.write("{0:d}\t0\t-\t-\n".format(linecount))
+            return
+        nbest = aligner.nbest
+        self.out_file.write("{0:d}\t{1:d}\t{2:d}\t{3:d}\n".format(linecount, nbest.size, nbest.wer_rank, nbest.power_rank))
+        self.entries += nbest.size
+        self.aligned += nbest.aligned
+        self.rows += nbest.rows
+        self.words += nbest.words
+
+    def finalize(self):
+        self.out_file.close()
+        print("N-best entries: {0:d}; aligned in full: {1:d}; DP rows computed for the oracle search: {2:d} "
+              "({3:d} without shared prefixes)".format(self.entries, self.aligned, self.rows, self.words))
+
+
+class System(object):
+    '''The output writers and score totals of one hypothesis file.'''
+    def __init__(self, args, hypfile, prefix, totals):
+        self.hypfile = hypfile
+        self.prefix = prefix
+        self.name = prefix[len(args.output) + 1:] or os.path.basename(hypfile)
+        self.totals = totals
+        self.wer_writers = []
+        self.power_writers = []
+        self.final_wer = self.final_power = None
+
+    def open_writers(self, args):
         for i in range(len(args.format)):
             # Open files for writing POWER
-            filepath = "{0}.power.{1}".format(args.output, args.format[i])
-            power_writers.append(writers.CreateWriter(
-                args.format[i], filepath, args.hypfile, args.reffile))
+            filepath = "{0}.power.{1}".format(self.prefix, args.format[i])
+            self.power_writers.append(writers.CreateWriter(
+                args.format[i], filepath, self.hypfile, args.reffile))
             if args.print_wer:
                 # Open files for writing WER
-                filepath = "{0}.wer.{1}".format(args.output, args.format[i])
-                wer_writers.append(writers.CreateWriter(
-                    args.format[i], filepath, args.hypfile, args.reffile))
+                filepath = "{0}.wer.{1}".format(self.prefix, args.format[i])
+                self.wer_writers.append(writers.CreateWriter(
+                    args.format[i], filepath, self.hypfile, args.reffile))
 
-        # Assume that line counts match
-        for refline in f_ref:
-            linecount += 1
+    def write_segment(self, args, linecount, refline, hypline, aligner):
+        blank_lines = aligner is None
+        if not blank_lines:
+            self.totals.add(aligner)
 
             if args.verbose:
-                print('===========')
-                print('Segment {0:d}:'.format(linecount))
-                print('===========')
-
-            refline = refline.strip()
-            hypline = f_hyp.readline().strip()
-            blank_lines = False
-            if not refline and not hypline:
-                # Nothing to compare
-                blank_lines = True
-            else:
-                if args.verbose:
-                    print('REF: "{0}"'.format(refline))
+                print('REF: "{0}"'.format(refline))
+                nbest = getattr(aligner, 'nbest', None)
+                if nbest is None:
                     print('HYP: "{0}"'.format(hypline))
-
-                aligner = None
-                if args.word_align_weights:
-                    keys = ['C', 'S', 'D', 'I']
-                    word_align_weights = dict(zip(keys, args.word_align_weights))
-                    aligner = PowerAligner(refline, hypline, lowercase=args.lowercase, verbose=args.verbose,
-                                            lexicon=args.lexicon, word_align_weights=word_align_weights)
                 else:
-                    aligner = PowerAligner(refline, hypline, lowercase=args.lowercase, verbose=args.verbose,
-                                            lexicon=args.lexicon)
-                wer_score_components += Counter(aligner.wer_components)
+                    # The WER and POWER alignments may come from different entries
+                    print('WER HYP (n-best entry {0:d}): "{1}"'.format(nbest.wer_rank, nbest.wer_hyp))
+                    print('POWER HYP (n-best entry {0:d}): "{1}"'.format(nbest.power_rank, nbest.power_hyp))
 
-                if args.print_wer:
-                    for writer in wer_writers:
-                        if blank_lines:
-                            writer.write_blank()
-                        else:
-                            writer.write(linecount, aligner.wer_components, aligner.wer_alignment)
+            if args.print_wer:
+                for writer in self.wer_writers:
+                    writer.write(linecount, aligner.wer_components, aligner.wer_alignment)
 
-                if args.verbose:
-                    print('WER alignment:')
-                    print(aligner.wer_alignment)
-                    print('WER:   ', aligner.wer)
-                    print('Errors:', aligner.wer_components)
-                    print('===============')
-
-                aligner.align()
-                power_score_components += Counter(aligner.power_components)
-
-                if args.show_confusions:
-                    if args.print_wer:
-                        # TODO: Refactor
-                        cp = aligner.wer_alignment.confusion_pairs()
-                        for key in cp.keys():
-                            wer_confusions[key] += cp[key]
-
-                    cp = aligner.power_alignment.confusion_pairs()
-                    for key in cp.keys():
-                        power_confusions[key] += cp[key]
+            if args.verbose:
+                print('WER alignment:')
+                print(aligner.wer_alignment)
+                print('WER:   ', aligner.wer)
+                print('Errors:', aligner.wer_components)
+                print('===============')
 
-                if args.verbose:
-                    print('Error Regions:')
-                    for i in aligner.error_indexes:
-                        print(aligner.split_regions[i])
-                        print(aligner.phonetic_alignments[i])
-                        print('-----')
-                    print('===============')
-                    print('POWER alignment:')
-                    print(aligner.power_alignment)
-                    print('POWER: ', aligner.power)
-                    print('Errors:', aligner.power_components)
-                    print('===============')
-                    print("")
-
-            # Write POWER info
-            for writer in power_writers:
-                if blank_lines:
-                    writer.write_blank()
-                elif args.show_phonemes:
-                    writer.write(linecount, aligner.power_components,
-                                 aligner.power_alignment, aligner.phonetic_alignments)
-                else:
-                    writer.write(linecount, aligner.power_components, aligner.power_alignment)
+            if args.verbose:
+                print('Error Regions:')
+                for i in aligner.error_indexes:
+                    print(aligner.split_regions[i])
+                    print(aligner.phonetic_alignments[i])
+                    print('-----')
+                print('Phone realignments avoided:', getattr(aligner, 'realignments_avoided', 0))
+                print('===============')
+                print('POWER alignment:')
+                print(aligner.power_alignment)
+                print('POWER: ', aligner.power)
+                print('Errors:', aligner.power_components)
+                print('===============')
+                print("")
 
-    # Close all output files
-    for writer in wer_writers:
-        writer.finalize()
-    for writer in power_writers:
-        writer.finalize()
-
-    # Compare final WER to POWER
-    print("=============")
-    print("Final scores:")
-    final_wer = (wer_score_components['S'] + wer_score_components['D'] +
-                 wer_score_components['I']) / wer_score_components['L']
-
-    final_power = (power_score_components['S'] + power_score_components['D'] +
-                   power_score_components['I']) / power_score_components['L']
-    print("WER:   {0:1.3f}".format(final_wer))
-    print(wer_score_components)
-    print("POWER: {0:1.3f}".format(final_power))
-    print(power_score_components)
-
-    diff_score = final_power - final_wer
-    diff_components = copy.deepcopy(power_score_components)
-    diff_components.subtract(wer_score_components)
-
-    print("")
-    print("Score component difference (POWER vs WER):")
-    print("Diff: {0:1.3f}".format(diff_score))
-    print(diff_components)
-    print("=============")
-
-    if args.compare:
-        writers.CompareWriter.write_comparison("{}.rsum" % args.output, args.hypfile, args.reffile, linecount,
-                                               final_power, final_wer, power_score_components, wer_score_components, diff_score, diff_components)
-    if args.show_confusions:
-        if 'txt' in args.show_confusions:
-            writers.ConfusionPairWriter.write(
-                "{}.power.conf".format(args.output), args.hypfile, args.reffile, power_confusions)
-            if args.print_wer:
+        # Write POWER info
+        for writer in self.power_writers:
+            if blank_lines:
+                writer.write_blank()
+            elif args.show_phonemes:
+                writer.write(linecount, aligner.power_components,
+                             aligner.power_alignment, aligner.phonetic_alignments)
+            else:
+                writer.write(linecount, aligner.power_components, aligner.power_alignment)
+
+    def finalize(self):
+        for writer in self.wer_writers:
+            writer.finalize()
+        for writer in self.power_writers:
+            writer.finalize()
+
+    def report(self, args, linecount):
+        '''Prints the final scores, and writes the comparison and confusion files of the system.'''
+        wer_score_components = self.totals.wer_components
+        power_score_components = self.totals.power_components
+        wer_confusions = self.totals.wer_confusions
+        power_confusions = self.totals.power_confusions
+
+        # Compare final WER to POWER
+        print("=============")
+        print("Final scores:")
+        self.final_wer = final_wer = (wer_score_components['S'] + wer_score_components['D'] +
+                                      wer_score_components['I']) / wer_score_components['L']
+
+        self.final_power = final_power = (power_score_components['S'] + power_score_components['D'] +
+                                          power_score_components['I']) / power_score_components['L']
+        print("WER:   {0:1.3f}".format(final_wer))
+        print(wer_score_components)
+        print("POWER: {0:1.3f}".format(final_power))
+        print(power_score_components)
+
+        diff_score = final_power - final_wer
+        diff_components = copy.deepcopy(power_score_components)
+        diff_components.subtract(wer_score_components)
+
+        print("")
+        print("Score component difference (POWER vs WER):")
+        print("Diff: {0:1.3f}".format(diff_score))
+        print(diff_components)
+        print("=============")
+
+        if args.compare:
+            writers.CompareWriter.write_comparison("{}.rsum".format(self.prefix), self.hypfile, args.reffile, linecount,
+                                                   final_power, final_wer, power_score_components, wer_score_components, diff_score, diff_components)
+        if args.show_confusions:
+            if 'txt' in args.show_confusions:
                 writers.ConfusionPairWriter.write(
-                    "{}.wer.conf".format(args.output), args.hypfile, args.reffile, wer_confusions)
-        if 'json' in args.show_confusions:
-            writers.ConfusionPairWriter.write_json(
-                "{}.power.conf.json".format(args.output), args.hypfile, args.reffile, power_confusions)
-            if args.print_wer:
+                    "{}.power.conf".format(self.prefix), self.hypfile, args.reffile, power_confusions)
+                if args.print_wer:
+                    writers.ConfusionPairWriter.write(
+                        "{}.wer.conf".format(self.prefix), self.hypfile, args.reffile, wer_confusions)
+            if 'json' in args.show_confusions:
                 writers.ConfusionPairWriter.write_json(
-                    "{}.wer.conf.json".format(args.output), args.hypfile, args.reffile, wer_confusions)
+                    "{}.power.conf.json".format(self.prefix), self.hypfile, args.reffile, power_confusions)
+                if args.print_wer:
+                    writers.ConfusionPairWriter.write_json(
+                        "{}.wer.conf.json".format(self.prefix), self.hypfile, args.reffile, wer_confusions)
+
+    def summary(self, linecount):
+        '''The row of the system in the comparison table (see writers.SystemsWriter); call after report().'''
+        return (self.name, self.hypfile, linecount, self.final_wer, self.final_power,
+                self.totals.wer_components, self.totals.power_components)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
 from __future__ import division
-from collections import deque
-from power.levenshtein import Levenshtein, ExpandedAlignment, AlignLabels
+from collections import Counter, deque
+from power.cache import LRUCache
+from power.levenshtein import Levenshtein, ExpandedAlignment, AlignLabels, AlignEngine, AlignMode, SubstitutionTable
 from power.phonemes import Phonemes
-from power.pronounce import PronouncerType, PronouncerBase, PronouncerLex
+from power.pronounce import PronouncerType, get_pronouncer
 
 class TokType:
     WordBoundary = 1
@@ -109,6 +110,39 @@ class CharToWordAligner:
         self.word_align = ExpandedAlignment(ref_word_align, hyp_word_align, align_word, lowercase=self.lowercase)
         return self.word_align	
             
+class AlignResult:
+    '''
+    Compact results of a segment aligned by PowerAligner.align_batch: WER and POWER rates and score components,
+    and the alignment labels as strings (e.g. 'CSCI'). The ExpandedAlignments are only kept if requested, as
+    CompactAlignments interned in vocabulary if one is given.
+    '''
+    def __init__(self, aligner, alignments=False, vocabulary=None):
+        self.wer = aligner.wer
+        self.wer_components = aligner.wer_components
+        self.wer_labels = ''.join(aligner.wer_alignment.align)
+        self.power = aligner.power
+        self.power_components = aligner.power_components
+        self.power_labels = ''.join(aligner.power_alignment.align)
+        self.wer_alignment = None
+        self.power_alignment = None
+        if alignments and vocabulary is not None:
+            self.wer_alignment = aligner.wer_alignment.compact(vocabulary)
+            self.power_alignment = aligner.power_alignment.compact(vocabulary)
+        elif alignments:
+            self.wer_alignment = aligner.wer_alignment
+            self.power_alignment = aligner.power_alignment
+
+    @staticmethod
+    def totals(results):
+        '''Sums the (wer_components, power_components) of results as Counters, skipping blank segments (None).'''
+        wer_components = Counter()
+        power_components = Counter()
+        for result in results:
+            if result is not None:
+                wer_components.update(result.wer_components)
+                power_components.update(result.power_components)
+        return wer_components, power_components
+
 class PowerAligner:
     # Exclusive tokens that can only align to themselves; not other members in this set.
     reserve_list = set(['|', '#'])
@@ -117,20 +151,29 @@ class PowerAligner:
     r_set = set.union(set('r'), Phonemes.r_vowels)
     exclusive_sets = [Phonemes.vowels, Phonemes.consonants, r_set]
     
+    # Phone inventory interned once, with the substitution rules above precomputed for every phone pair.
+    phone_table = SubstitutionTable(reserve_list, exclusive_sets,
+                                    sorted(set.union(reserve_list, Phonemes.vowels, Phonemes.consonants, r_set)))
+    
     phoneDistPenalty    = 0.25
     phoneDistPenalt16ySet = set(['|'])
     
     def __init__(self, ref, hyp, lowercase=False, verbose=False,
                 pronounce_type=PronouncerType.Lexicon,
                 lexicon=None,
-                word_align_weights=Levenshtein.wordAlignWeights):
+                word_align_weights=Levenshtein.wordAlignWeights,
+                pronouncer=None,
+                engine=AlignEngine.Python,
+                word_align_mode=AlignMode.Full,
+                phone_memo=None):
         if not ref:
             raise Exception("No reference file.\nref: {0}\nhyp: {1}".format(ref, hyp))
 
-        if pronounce_type == PronouncerType.Lexicon:
-            self.pronouncer = PronouncerLex(lexicon)
+        # Reuse a ready pronouncer if given; otherwise share one per lexicon across the process.
+        if pronouncer is not None:
+            self.pronouncer = pronouncer
         else:
-            self.pronouncer = PronouncerBase()
+            self.pronouncer = get_pronouncer(lexicon, pronounce_type)
         
         self.ref = [x for x in ref.strip().split() if x]
         self.hyp = [x for x in hyp.strip().split() if x]
@@ -139,11 +182,11 @@ class PowerAligner:
         
         self.lowercase = lowercase
         self.verbose = verbose
+        self.engine = engine
         
         # Perform word alignment
-        lev = Levenshtein.align(self.ref, self.hyp, lowercase=self.lowercase, weights=word_align_weights)
-        lev.editops()
-        self.wer_alignment = lev.expandAlign()
+        self.wer_alignment = Levenshtein.expandedAlign(self.ref, self.hyp, mode=word_align_mode, engine=self.engine,
+                                                       lowercase=self.lowercase, weights=word_align_weights)
         self.wer, self.wer_components = self.wer_alignment.error_rate()
         
         # Used for POWER alignment
@@ -156,11 +199,17 @@ class PowerAligner:
         self.error_indexes = None
         self.phonetic_alignments = None
         self.phonetic_lev = None
+
+        # Phone realignments solved once per segment, or across segments if an LRUCache is shared
+        self.phone_memo = phone_memo
+        self.realignments_avoided = 0
         
     def align(self):
         # Find the error regions that may need to be realigned
         self.split_regions, self.error_indexes = self.wer_alignment.split_error_regions()
         self.phonetic_alignments = [None] * len(self.split_regions)
+        memo = self.phone_memo if self.phone_memo is not None else LRUCache(None)
+        hits = memo.hits
 
         for error_index in self.error_indexes:
             seg = self.split_regions[error_index]
@@ -170,12 +219,15 @@ class PowerAligner:
             hyp_phones = self.pronouncer.pronounce(hyp_words)
 
             power_seg_alignment, self.phonetic_alignments[error_index] = PowerAligner.phoneAlignToWordAlign(ref_words, hyp_words, 
-                ref_phones, hyp_phones)
+                ref_phones, hyp_phones, engine=self.engine, memo=memo)
 
             # Replace the error region at the current index.
             self.split_regions[error_index] = power_seg_alignment
 
+        self.realignments_avoided = memo.hits - hits
+
         # Merge the alignment segments back together.
+        self.split_regions[0].materialize()
         self.power_alignment = ExpandedAlignment(self.split_regions[0].s1, self.split_regions[0].s2, 
                 self.split_regions[0].align, 
                 self.split_regions[0].s1_map, self.split_regions[0].s2_map, lowercase=self.lowercase)
@@ -188,20 +240,82 @@ class PowerAligner:
         assert self.hypwords == self.power_alignment.s2_string(), "hyp mismatch:\n{0}\n{1}".format(self.hypwords, self.power_alignment.s2_string())
         assert self.refwords == self.power_alignment.s1_string(), "ref mismatch:\n{0}\n{1}".format(self.refwords, self.power_alignment.s1_string())
   
+    @classmethod
+    def align_batch(cls, pairs, lowercase=False, pronounce_type=PronouncerType.Lexicon, lexicon=None,
+                    word_align_weights=Levenshtein.wordAlignWeights, pronouncer=None, engine=AlignEngine.Python,
+                    word_align_mode=AlignMode.Full, alignments=False, vocabulary=None, phone_memo=None):
+        '''
+        Aligns many (ref, hyp) string pairs with the same options, and returns a list with an AlignResult per pair
+        (None for pairs where both strings are blank).
+        What the batch amortizes: the pronouncer is set up once; phone realignments are shared by all pairs through
+        phone_memo (an LRUCache, a new one by default); and pairs with the same tokens (ignoring case with
+        lowercase=True, unless alignments are kept, since they show the words as written) are aligned once and
+        share their AlignResult. Otherwise each pair is tokenized and aligned by its own PowerAligner.
+        With alignments=True, the results keep the WER and POWER ExpandedAlignments, or CompactAlignments sharing
+        vocabulary (a levenshtein.Vocabulary) if one is given.
+        '''
+        if pronouncer is None:
+            pronouncer = get_pronouncer(lexicon, pronounce_type)
+        if phone_memo is None:
+            phone_memo = LRUCache()
+        done = {}
+        results = []
+        for ref, hyp in pairs:
+            ref_tokens = ref.split()
+            hyp_tokens = hyp.split()
+            key = (tuple(ref_tokens), tuple(hyp_tokens))
+            if lowercase and not alignments:
+                key = (tuple(x.lower() for x in ref_tokens), tuple(x.lower() for x in hyp_tokens))
+            if key not in done:
+                if not ref_tokens and not hyp_tokens:
+                    done[key] = None
+                else:
+                    aligner = cls(' '.join(ref_tokens), ' '.join(hyp_tokens), lowercase=lowercase,
+                                  word_align_weights=word_align_weights, pronouncer=pronouncer, engine=engine,
+                                  word_align_mode=word_align_mode, phone_memo=phone_memo)
+                    aligner.align()
+                    done[key] = AlignResult(aligner, alignments, vocabulary)
+            results.append(done[key])
+        return results
+
+    @staticmethod
+    def alignPhones(ref_phones, hyp_phones, engine=AlignEngine.Python, memo=None):
+        '''
+        Compact phone alignment (see Levenshtein.expandAlignCompact) of two phone sequences.
+        If memo (an LRUCache) is given, each distinct pair is aligned once; its hits count the alignments avoided.
+        Every call returns a new ExpandedAlignment, so callers may change it.
+        '''
+        weights = Levenshtein.wordAlignWeights
+        key = (tuple(ref_phones), tuple(hyp_phones), tuple(sorted(weights.items())), engine)
+        alignment = memo.get(key) if memo is not None else None
+        if alignment is None:
+            lev = Levenshtein.align(ref=ref_phones,
+                                    hyp=hyp_phones,
+                                    substitution_table=PowerAligner.phone_table,
+                                    weights=weights, engine=engine) #,
+                                    #dist_penalty=PowerAligner.phoneDistPenalty, dist_penalty_set=Levenshtein.wordAlignWeights)
+            alignment = lev.expandAlignCompact()
+            if memo is not None:
+                memo.put(key, alignment)
+        return ExpandedAlignment(list(alignment.s1), list(alignment.s2), list(alignment.align),
+                                 list(alignment.s1_map), list(alignment.s2_map), lowercase=alignment.lowercase)
+
     # TODO: Make this simpler (and maybe recursive)
     @classmethod
-    def phoneAlignToWordAlign(cls, ref_words, hyp_words, ref_phones, hyp_phones, break_on_syllables=True):
+    def phoneAlignToWordAlign(cls, ref_words, hyp_words, ref_phones, hyp_phones, break_on_syllables=True,
+                              engine=AlignEngine.Python, memo=None):
+        '''
+        Aligns ref_words and hyp_words through the alignment of their phones. The remainders of the span are
+        realigned as words are committed, often on phone sequences aligned before; these realignments are
+        solved once per call, or once per memo (an LRUCache, see alignPhones) if one is given.
+        '''
+        if memo is None:
+            memo = LRUCache(None)
         ref_word_span = (0, len(ref_words))
         hyp_word_span = (0, len(hyp_words))
         
         # Perform Levenshtein Alignment
-        lev = Levenshtein.align(ref=ref_phones, 
-                            hyp=hyp_phones,
-                            reserve_list=PowerAligner.reserve_list, 
-                            exclusive_sets=PowerAligner.exclusive_sets,
-                            weights=Levenshtein.wordAlignWeights) #, 
-                            #dist_penalty=PowerAligner.phoneDistPenalty, dist_penalty_set=Levenshtein.wordAlignWeights)				
-        phone_align = lev.expandAlignCompact()
+        phone_align = PowerAligner.alignPhones(ref_phones, hyp_phones, engine=engine, memo=memo)
         
         worklist = list()
         worklist.append((ref_word_span, hyp_word_span, phone_align))
@@ -301,15 +415,8 @@ class PowerAligner:
                                     hyp_word_span_curr = (hyp_word_index, hyp_word_index + len(hyp_word_builder))
                                     phone_align_curr = phone_align.subsequence(0, i+1, preserve_index=False)
                                     
-                                    lev = Levenshtein.align(
-                                        ref=phone_align_curr.s1_tokens(), 
-                                        hyp=phone_align_curr.s2_tokens(),
-                                        reserve_list=PowerAligner.reserve_list, 
-                                        exclusive_sets=PowerAligner.exclusive_sets,
-                                        weights=Levenshtein.wordAlignWeights) #, 
-                                        #dist_penalty=PowerAligner.phoneDistPenalty, dist_penalty_set=Levenshtein.wordAlignWeights)
-                                        
-                                    phone_align_adjusted = lev.expandAlignCompact()
+                                    phone_align_adjusted = PowerAligner.alignPhones(phone_align_curr.s1_tokens(),
+                                        phone_align_curr.s2_tokens(), engine=engine, memo=memo)
                                     
                                     if phone_align_curr.align != phone_align_adjusted.align:
                                         # Looks like we need to redo the phone-to-word alignment.
@@ -371,14 +478,8 @@ class PowerAligner:
                             # Add the remainder to the worklist
                             ref_word_span_next = (ref_word_index + len(ref_word_builder), ref_word_limit)
                             hyp_word_span_next = (hyp_word_index + len(hyp_word_builder), hyp_word_limit)
-                            lev = Levenshtein.align(
-                                ref=[x for x in phone_align.s1[i:] if x],
-                                hyp=[x for x in phone_align.s2 if x],
-                                reserve_list=PowerAligner.reserve_list, 
-                                exclusive_sets=PowerAligner.exclusive_sets,
-                                weights=Levenshtein.wordAlignWeights) #, 
-                                #dist_penalty=PowerAligner.phoneDistPenalty, dist_penalty_set=Levenshtein.wordAlignWeights)
-                            phone_align_next = lev.expandAlignCompact()
+                            phone_align_next = PowerAligner.alignPhones([x for x in phone_align.s1[i:] if x],
+                                [x for x in phone_align.s2 if x], engine=engine, memo=memo)
                             
                             worklist.append((ref_word_span_next, hyp_word_span_next, phone_align_next))
                             break					
@@ -411,14 +512,8 @@ class PowerAligner:
                             # Add the remainder to the worklist
                             ref_word_span_next = (ref_word_index + len(ref_word_builder), ref_word_limit)
                             hyp_word_span_next = (hyp_word_index + len(hyp_word_builder), hyp_word_limit)
-                            lev = Levenshtein.align(
-                                ref=[x for x in phone_align.s1 if x],
-                                hyp=[x for x in phone_align.s2[i:] if x],
-                                reserve_list=PowerAligner.reserve_list, 
-                                exclusive_sets=PowerAligner.exclusive_sets,
-                                weights=Levenshtein.wordAlignWeights) #, 
-                                #dist_penalty=PowerAligner.phoneDistPenalty, dist_penalty_set=Levenshtein.wordAlignWeights)
-                            phone_align_next = lev.expandAlignCompact()
+                            phone_align_next = PowerAligner.alignPhones([x for x in phone_align.s1 if x],
+                                [x for x in phone_align.s2[i:] if x], engine=engine, memo=memo)
                             
                             worklist.append((ref_word_span_next, hyp_word_span_next, phone_align_next))
                             break
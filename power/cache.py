@@ -0,0 +1,117 @@
+'''
+Bounded in-memory caches and persistent on-disk caches.
+'''
+import os
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''
+    Least-recently-used cache holding at most maxsize entries (unbounded if maxsize is None).
+    Counts hits, misses and evictions, so the cache can be sized from a real run.
+    '''
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def __str__(self):
+        return "hits: {hits}, misses: {misses}, evictions: {evictions}, size: {size}/{maxsize}".format(**self.stats())
+
+
+class SqliteCache(object):
+    '''
+    Persistent string key/value store in a local sqlite file, shared by runs and processes.
+    Keys live in a namespace (e.g. a lexicon fingerprint), so entries derived from different inputs never mix.
+    The database uses write-ahead logging, so concurrent readers are not blocked by a writer. Each process opens
+    its own connection on first use, so a store can be created before worker processes are forked.
+    '''
+    def __init__(self, filepath, namespace=''):
+        self.filepath = filepath
+        self.namespace = namespace
+        self._conn = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        import sqlite3
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.filepath, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                               'PRIMARY KEY (namespace, key))')
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key, default=None):
+        row = self._connection().execute('SELECT value FROM cache WHERE namespace = ? AND key = ?',
+                                         (self.namespace, key)).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, value):
+        self._connection().execute('INSERT OR REPLACE INTO cache (namespace, key, value) VALUES (?, ?, ?)',
+                                   (self.namespace, key, value))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache WHERE namespace = ?',
+                                          (self.namespace,)).fetchone()[0]
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def __getstate__(self):
+        # Connections can't be pickled; the receiving process opens its own.
+        state = dict(self.__dict__)
+        state['_conn'] = None
+        return state
@@ -1,5 +1,7 @@
 from __future__ import division
+import bisect
 import re
+from array import array
 from collections import Counter, defaultdict, deque
 import itertools
 
@@ -12,6 +14,23 @@ class AlignLabels:
     validOptions = set([correct, substitution, insertion, deletion])
 
 
+class AlignEngine:
+    '''Dynamic programming engines for Levenshtein.align.'''
+    Python = "python"
+    NumPy = "numpy"
+
+
+class AlignMode:
+    '''
+    How much of the alignment matrix is explored. Every mode but Anchored yields the same alignment as the full
+    matrix; Anchored is a heuristic for long documents (see Levenshtein.alignAnchored).
+    '''
+    Full = "full"
+    Banded = "banded"
+    Linear = "linear"
+    Anchored = "anchored"
+
+
 class ExpandedAlignment:
     '''Levenshtein-aligned reference and hypothesis, not just edit distance score.'''
 
@@ -45,6 +64,22 @@ class ExpandedAlignment:
 
         return value
 
+    def to_dict(self):
+        '''JSON-serializable copy of the alignment, including its token maps.'''
+        return {'s1': list(self.s1), 's2': list(self.s2), 'align': list(self.align),
+                's1_map': list(self.s1_map), 's2_map': list(self.s2_map), 'lowercase': self.lowercase}
+
+    @staticmethod
+    def from_dict(d):
+        '''
+        Inverse of to_dict. The token maps are restored as stored, not recomputed. The lists are copied, so the
+        alignment can be changed without changing d (e.g. a cached result).
+        '''
+        alignment = ExpandedAlignment(list(d['s1']), list(d['s2']), list(d['align']), lowercase=d['lowercase'])
+        alignment.s1_map = list(d['s1_map'])
+        alignment.s2_map = list(d['s2_map'])
+        return alignment
+
     def s1_string(self):
         return ' '.join(self.s1_tokens())
 
@@ -79,13 +114,19 @@ class ExpandedAlignment:
         return s1_idx, s2_idx
 
     def subsequence(self, i, j, preserve_index=False):
+        '''
+        Alignment points i to j, as an AlignmentView that shares this alignment's lists until it is changed.
+        '''
         # TODO: Right now we're losing any s1_map and s2_map components for compatibility reasons. Refactoring necessary.
-        scale = 0 if preserve_index else i
-        s1_map = [self.s1_map[k] -
-                  scale for k in range(len(self.s1_map)) if i <= self.s1_map[k] < j]
-        s2_map = [self.s2_map[k] -
-                  scale for k in range(len(self.s2_map)) if i <= self.s2_map[k] < j]
-        return ExpandedAlignment(self.s1[i:j], self.s2[i:j], self.align[i:j], s1_map, s2_map, lowercase=self.lowercase)
+        return AlignmentView(self, i, j, preserve_index)
+
+    def materialize(self):
+        '''Returns the alignment with lists of its own; see AlignmentView.'''
+        return self
+
+    def compact(self, vocabulary):
+        '''CompactAlignment of this alignment, with its entries interned in vocabulary.'''
+        return CompactAlignment.from_alignment(self, vocabulary)
 
     def split_error_regions(self, error_pattern='[SDI]*S[SDI]+|[SDI]+S[SDI]*'):
         '''
@@ -230,6 +271,414 @@ class ExpandedAlignment:
         return alignment
 
 
+class SequenceView(object):
+    '''
+    Read-only view of base[start:stop], used for the s1, s2 and align lists of an AlignmentView. It compares equal
+    to the list it stands for, and slicing it returns a list. Changing it through the list methods below first
+    materializes its AlignmentView, and the change goes to the view's own list.
+    '''
+    __slots__ = ('owner', 'name', 'base', 'start', 'stop')
+
+    def __init__(self, owner, name, base, start, stop):
+        self.owner = owner
+        self.name = name
+        self.base = base
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self.base[self.start + start:self.start + max(start, stop)]
+            return [self.base[self.start + k] for k in range(start, stop, step)]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("list index out of range")
+        return self.base[self.start + key]
+
+    def __iter__(self):
+        base = self.base
+        for k in range(self.start, self.stop):
+            yield base[k]
+
+    def __contains__(self, value):
+        return value in self.base[self.start:self.stop]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, SequenceView)):
+            return self[:] == other[:]
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, (list, SequenceView)):
+            return self[:] != other[:]
+        return NotImplemented
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return self[:] + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self[:]
+
+    def __repr__(self):
+        return repr(self[:])
+
+    def index(self, value):
+        return self[:].index(value)
+
+    def count(self, value):
+        return self[:].count(value)
+
+    def _target(self):
+        self.owner.materialize()
+        return getattr(self.owner, self.name)
+
+    def __setitem__(self, key, value):
+        self._target()[key] = value
+
+    def __delitem__(self, key):
+        del self._target()[key]
+
+    def __iadd__(self, other):
+        target = self._target()
+        target += other
+        return target
+
+    def append(self, value):
+        self._target().append(value)
+
+    def extend(self, values):
+        self._target().extend(values)
+
+    def insert(self, index, value):
+        self._target().insert(index, value)
+
+    def pop(self, index=-1):
+        return self._target().pop(index)
+
+
+class AlignmentView(ExpandedAlignment):
+    '''
+    Alignment points i to j of a parent ExpandedAlignment, as returned by ExpandedAlignment.subsequence.
+    s1, s2 and align are SequenceViews of the parent's lists, so nothing is copied: nested views share the lists
+    of the first alignment with their own offsets. The token maps are found by bisecting the parent's maps when
+    first used. Changing the view (its lists, maps set aside, or append_alignment) materializes it: it copies its
+    slices and behaves as a plain ExpandedAlignment from then on. Until then, points of the parent that are
+    changed in place show through the view.
+    '''
+
+    def __init__(self, parent, i, j, preserve_index=False):
+        n = parent.length()
+        i = max(0, min(i, n))
+        j = max(0, min(j, n))
+        if j <= i:
+            raise Exception("No alignment: strings are empty")
+
+        if isinstance(parent, AlignmentView) and parent._lists is None:
+            self._base = parent._base
+            self._start = parent._start + i
+        else:
+            self._base = (parent.s1, parent.s2, parent.align)
+            self._start = i
+        self._stop = self._start + j - i
+        self._lists = None
+        # Where the token maps come from, until they are computed
+        self._parent = parent
+        self._span = (i, j, 0 if preserve_index else i)
+        self._s1_map = None
+        self._s2_map = None
+        self.lowercase = parent.lowercase
+
+    def _sequence(self, k, name):
+        if self._lists is not None:
+            return self._lists[k]
+        return SequenceView(self, name, self._base[k], self._start, self._stop)
+
+    def _replace(self, k, value):
+        self.materialize()
+        self._lists[k] = value
+
+    s1 = property(lambda self: self._sequence(0, 's1'), lambda self, value: self._replace(0, value))
+    s2 = property(lambda self: self._sequence(1, 's2'), lambda self, value: self._replace(1, value))
+    align = property(lambda self: self._sequence(2, 'align'), lambda self, value: self._replace(2, value))
+
+    def _maps(self):
+        '''
+        Computes the token maps as the ExpandedAlignment constructor would from the parent's maps restricted to
+        the view: they are recomputed unless only the s1 map has points in the view.
+        '''
+        parent = self._parent
+        i, j, scale = self._span
+
+        def restrict(parent_map):
+            lo = bisect.bisect_left(parent_map, i)
+            hi = bisect.bisect_left(parent_map, j, lo)
+            return [k - scale for k in parent_map[lo:hi]]
+
+        s2_map = restrict(parent.s2_map)
+        if s2_map:
+            self.recompute_alignment_maps()
+            return
+        s1_map = restrict(parent.s1_map)
+        if s1_map:
+            self._s1_map = s1_map
+            self._s2_map = s2_map
+        else:
+            self.recompute_alignment_maps()
+
+    def _get_s1_map(self):
+        if self._s1_map is None:
+            self._maps()
+        return self._s1_map
+
+    def _get_s2_map(self):
+        if self._s2_map is None:
+            self._maps()
+        return self._s2_map
+
+    def _set_s1_map(self, value):
+        self._s1_map = value
+
+    def _set_s2_map(self, value):
+        self._s2_map = value
+
+    s1_map = property(_get_s1_map, _set_s1_map)
+    s2_map = property(_get_s2_map, _set_s2_map)
+
+    def materialize(self):
+        '''Copies the view's slices (and computes its token maps), so it no longer refers to its parent.'''
+        if self._lists is None:
+            self._get_s1_map()
+            self._get_s2_map()
+            start, stop = self._start, self._stop
+            self._lists = [base[start:stop] for base in self._base]
+            self._base = None
+            self._parent = None
+        return self
+
+    def append_alignment(self, expanded_alignment):
+        self.materialize()
+        ExpandedAlignment.append_alignment(self, expanded_alignment)
+
+    def __deepcopy__(self, memo):
+        # A copy is independent of the parent anyway, so it is a plain alignment.
+        alignment = ExpandedAlignment(self.s1[:], self.s2[:], self.align[:], lowercase=self.lowercase)
+        alignment.s1_map = list(self.s1_map)
+        alignment.s2_map = list(self.s2_map)
+        return alignment
+
+    def __reduce__(self):
+        # Pickles as a plain alignment rather than with its parent.
+        return ExpandedAlignment.from_dict, (self.to_dict(),)
+
+
+class Vocabulary:
+    '''
+    Interns alignment entries (a token, several space-separated tokens of a POWER alignment, or '' for a gap) to
+    integer ids. A vocabulary is shared by many CompactAlignments, so each distinct entry is stored once.
+    '''
+
+    def __init__(self, tokens=()):
+        self.tokens = ['']
+        self.ids = {'': 0}
+        for token in tokens:
+            self.intern(token)
+
+    def intern(self, token):
+        tid = self.ids.get(token)
+        if tid is None:
+            tid = len(self.tokens)
+            self.ids[token] = tid
+            self.tokens.append(token)
+        return tid
+
+    def internTokens(self, tokens):
+        ids = self.ids
+        return [ids[x] if x in ids else self.intern(x) for x in tokens]
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+def _packed(values):
+    '''values in an array of the narrowest unsigned type that holds them.'''
+    top = max(values) if values else 0
+    if top < 1 << 8:
+        return array('B', values)
+    elif top < 1 << 16:
+        return array('H', values)
+    elif top < 1 << 32:
+        return array('I', values)
+    return array('Q', values)
+
+
+# Decodes the byte of each packed alignment label
+_label_table = [chr(k) for k in range(256)]
+
+
+class InternedSequence(object):
+    '''Read-only sequence of table[code] for each code in codes, e.g. the entries of a CompactAlignment.'''
+    __slots__ = ('codes', 'table')
+
+    def __init__(self, codes, table):
+        self.codes = codes
+        self.table = table
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            table = self.table
+            return [table[code] for code in self.codes[key]]
+        return self.table[self.codes[key]]
+
+    def __iter__(self):
+        table = self.table
+        for code in self.codes:
+            yield table[code]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, SequenceView, InternedSequence)):
+            return self[:] == other[:]
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, (list, SequenceView, InternedSequence)):
+            return self[:] != other[:]
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self[:])
+
+
+class CompactAlignment(object):
+    '''
+    Read-only ExpandedAlignment that takes little memory, for keeping many segments at once. There is no
+    per-instance dict. The entries of s1 and s2 are ids into a Vocabulary shared by all segments. The labels are
+    packed one byte per point. The ids and token maps use the narrowest integer arrays that fit.
+    s1, s2 and align read as sequences of strings, so the read-only methods of ExpandedAlignment (error_rate,
+    confusion_pairs, s1_tokens, __str__, ...) are shared with it. expand() returns a full ExpandedAlignment.
+    '''
+    __slots__ = ('vocabulary', 's1_ids', 's2_ids', 'labels', 's1_map', 's2_map', 'lowercase')
+
+    def __init__(self, vocabulary, s1_ids, s2_ids, labels, s1_map, s2_map, lowercase=False):
+        self.vocabulary = vocabulary
+        self.s1_ids = s1_ids
+        self.s2_ids = s2_ids
+        self.labels = labels
+        self.s1_map = s1_map
+        self.s2_map = s2_map
+        self.lowercase = lowercase
+
+    @staticmethod
+    def from_alignment(alignment, vocabulary):
+        '''Packs an ExpandedAlignment, interning its entries in vocabulary.'''
+        return CompactAlignment(vocabulary, _packed(vocabulary.internTokens(alignment.s1)),
+                                _packed(vocabulary.internTokens(alignment.s2)),
+                                ''.join(alignment.align).encode('ascii'),
+                                _packed(alignment.s1_map), _packed(alignment.s2_map), alignment.lowercase)
+
+    def expand(self):
+        '''ExpandedAlignment with the same entries and token maps (restored as stored, as in from_dict).'''
+        alignment = ExpandedAlignment(self.s1[:], self.s2[:], self.align[:], lowercase=self.lowercase)
+        alignment.s1_map = list(self.s1_map)
+        alignment.s2_map = list(self.s2_map)
+        return alignment
+
+    @property
+    def s1(self):
+        return InternedSequence(self.s1_ids, self.vocabulary.tokens)
+
+    @property
+    def s2(self):
+        return InternedSequence(self.s2_ids, self.vocabulary.tokens)
+
+    @property
+    def align(self):
+        return InternedSequence(self.labels, _label_table)
+
+    __str__ = ExpandedAlignment.__str__
+    to_dict = ExpandedAlignment.to_dict
+    s1_string = ExpandedAlignment.s1_string
+    s2_string = ExpandedAlignment.s2_string
+    s1_tokens = ExpandedAlignment.s1_tokens
+    s2_tokens = ExpandedAlignment.s2_tokens
+    s1_align_tokens = ExpandedAlignment.s1_align_tokens
+    s2_align_tokens = ExpandedAlignment.s2_align_tokens
+    ref = ExpandedAlignment.ref
+    hyp = ExpandedAlignment.hyp
+    length = ExpandedAlignment.length
+    pos = ExpandedAlignment.pos
+    error_rate = ExpandedAlignment.error_rate
+    confusion_pairs = ExpandedAlignment.confusion_pairs
+    alignment_capacity = ExpandedAlignment.alignment_capacity
+    hyp_oriented_alignment = ExpandedAlignment.hyp_oriented_alignment
+
+
+class SubstitutionTable:
+    '''
+    Interns tokens to small integer ids and records which pairs of ids may be substituted, so the alignment
+    engines only compare integers and do one table lookup per cell.
+    reserve_list and exclusive_sets have the same meaning as in Levenshtein.align. A table can be built once
+    (e.g. over a phone inventory) and shared across alignments; unseen tokens are interned on demand.
+    '''
+
+    def __init__(self, reserve_list=None, exclusive_sets=None, tokens=()):
+        self.reserve_list = reserve_list
+        self.exclusive_sets = exclusive_sets
+        self.ids = {}
+        self.masks = []
+        # rows[a][b] == 1 iff a may be substituted by b. Without any rules every pair may be substituted.
+        self.rows = [] if (reserve_list or exclusive_sets) else None
+        for token in tokens:
+            self.intern(token)
+
+    def familyMask(self, token):
+        '''
+        Bitmask of the substitution families of a token: two tokens may be substituted iff their masks intersect.
+        Reserved tokens get an empty mask, and tokens outside of all exclusive_sets share a family of their own.
+        '''
+        if self.reserve_list and token in self.reserve_list:
+            return 0
+        if not self.exclusive_sets:
+            return 1
+        bits = 0
+        for k in range(len(self.exclusive_sets)):
+            if token in self.exclusive_sets[k]:
+                bits |= 1 << k
+        return bits if bits else 1 << len(self.exclusive_sets)
+
+    def intern(self, token):
+        tid = self.ids.get(token)
+        if tid is None:
+            tid = len(self.masks)
+            mask = self.familyMask(token)
+            self.ids[token] = tid
+            self.masks.append(mask)
+            if self.rows is not None:
+                for other, row in zip(self.masks, self.rows):
+                    row.append(1 if other & mask else 0)
+                self.rows.append(bytearray(1 if other & mask else 0 for other in self.masks))
+        return tid
+
+    def internTokens(self, tokens):
+        ids = self.ids
+        return [ids[x] if x in ids else self.intern(x) for x in tokens]
+
+    def maySubstitute(self, id1, id2):
+        return self.rows is None or bool(self.rows[id1][id2])
+
+
 class Levenshtein:
     def __init__(self, lowercase=False, tokenMap=None):
         self.backMatrix = None
@@ -246,11 +695,15 @@ class Levenshtein:
                         AlignLabels.deletion: 3, AlignLabels.insertion: 3}
 
     @staticmethod
-    def align(ref, hyp, reserve_list=None, exclusive_sets=None, lowercase=False, weights=None, dist_penalty=0.5, dist_penalty_set=None):
+    def align(ref, hyp, reserve_list=None, exclusive_sets=None, lowercase=False, weights=None, dist_penalty=0.5, dist_penalty_set=None,
+              engine=AlignEngine.Python, substitution_table=None):
         '''
         Creates an alignment with hyp x ref matrix.
         reserve_list defines tokens that may never have 'S' alignments.
         exclusive_sets defines families of tokens that can have 'S' alignments. Anything outside of exclusive_sets can be aligned to any other nonmember.
+        substitution_table (a SubstitutionTable) replaces reserve_list and exclusive_sets with precompiled rules.
+        engine selects how the matrix is filled (see AlignEngine). The NumPy engine gives the same backtrack
+        options as the Python engine, but does not support distance penalties and falls back to Python for them.
         '''
         if not weights:
             weights = Levenshtein.uniformWeights
@@ -266,90 +719,577 @@ class Levenshtein:
             ref = [x.lower() for x in ref]
             hyp = [x.lower() for x in hyp]
 
+        ref_ids, hyp_ids, table = Levenshtein.internTokens(ref, hyp, reserve_list, exclusive_sets, substitution_table)
+
+        if engine == AlignEngine.NumPy and not dist_penalty_set:
+            lev.backMatrix = NumpyBackTrackMatrix(ref_ids, hyp_ids, table, weights)
+            lev.dist = lev.backMatrix.getWeight(
+                lev.backMatrix.hyplen, lev.backMatrix.reflen)
+            return lev
+        elif engine not in (AlignEngine.Python, AlignEngine.NumPy):
+            raise ValueError("Unknown alignment engine: %s" % engine)
+
         #pp = pprint.PrettyPrinter(width=300)
         lev.backMatrix = BackTrackMatrix(len(ref), len(hyp), weights)
+        matrix = lev.backMatrix.matrix
+
+        w_c = weights[AlignLabels.correct]
+        w_s = weights[AlignLabels.substitution]
+        w_d = weights[AlignLabels.deletion]
+        w_i = weights[AlignLabels.insertion]
 
         # Starts with 1st word in hyp
-        for index2, char2 in enumerate(hyp):
+        for index2, char2 in enumerate(hyp_ids):
 
-            if dist_penalty_set and char2 not in dist_penalty_set:
+            if dist_penalty_set and hyp[index2] not in dist_penalty_set:
                 distPenaltyRef += 1
             else:
                 distPenaltyRef = 0
 
+            prev_row = matrix[index2]
+            cur_row = matrix[index2+1]
+            sub_row = table.rows[char2] if table.rows is not None else None
+
             # Loop through columns, corresponding to characters in hyp
-            for index1, char1 in enumerate(ref):
-                if dist_penalty_set and char1 not in dist_penalty_set:
+            for index1, char1 in enumerate(ref_ids):
+                if dist_penalty_set and ref[index1] not in dist_penalty_set:
                     distPenaltyHyp += 1
                 else:
                     distPenaltyHyp = 0
 
-                match_char = AlignLabels.substitution
                 # Add insert/delete options
-                insPenalty = lev.backMatrix.getWeight(
-                    index2, index1+1) + weights[AlignLabels.insertion]
-                delPenalty = lev.backMatrix.getWeight(
-                    index2+1, index1) + weights[AlignLabels.deletion]
+                insPenalty = prev_row[index1+1].weight + w_i
+                delPenalty = cur_row[index1].weight + w_d
 
                 if dist_penalty_set:
-                    insPenalty += (distPenaltyHyp * dist_penalty) * \
-                        weights[AlignLabels.insertion]
-                    delPenalty += (distPenaltyRef * dist_penalty) * \
-                        weights[AlignLabels.deletion]
+                    insPenalty += (distPenaltyHyp * dist_penalty) * w_i
+                    delPenalty += (distPenaltyRef * dist_penalty) * w_d
 
-                opts = [insPenalty,  # I
-                        delPenalty,   # D
-                        ]
+                minDist = min(insPenalty, delPenalty)
 
+                # C if the ids match; S if the substitution table allows it
+                diagPenalty = None
                 if char1 == char2:
-                    opts.append(lev.backMatrix.getWeight(
-                        index2, index1) + weights[AlignLabels.correct])  # C
+                    diagPenalty = prev_row[index1].weight + w_c
                     match_char = AlignLabels.correct
-                elif not reserve_list or not (char1 in reserve_list or char2 in reserve_list):
-                    if exclusive_sets:
-                        # Check if char1 and char2 belong to the same exclusive set
-                        no_membership_set = set([-1])
-
-                        # Change this to handle multiple set membership
-                        char1_sets = set(
-                            [k for k in range(len(exclusive_sets)) if char1 in exclusive_sets[k]])
-                        if not char1_sets:
-                            char1_sets = no_membership_set
-                        char2_sets = set(
-                            [k for k in range(len(exclusive_sets)) if char2 in exclusive_sets[k]])
-                        if not char2_sets:
-                            char2_sets = no_membership_set
-
-                        if set.intersection(char1_sets, char2_sets):
-                            opts.append(lev.backMatrix.getWeight(
-                                index2, index1) + weights[AlignLabels.substitution])  # S
-                    else:
-                        opts.append(lev.backMatrix.getWeight(
-                            index2, index1) + weights[AlignLabels.substitution])     # S
-
-                # Get the locally minimum score and edit operation
-                minDist = min(opts)
-                minIndices = [i for i in reversed(
-                    range(len(opts))) if opts[i] == minDist]
+                elif sub_row is None or sub_row[char1]:
+                    diagPenalty = prev_row[index1].weight + w_s
+                    match_char = AlignLabels.substitution
+                if diagPenalty is not None and diagPenalty < minDist:
+                    minDist = diagPenalty
 
-                # Build the backtrack
+                # Build the backtrack, preferring C/S over D over I
                 alignLabels = []
-                for minIndex in minIndices:
-                    if minIndex == 2:
-                        alignLabels.append(match_char)
-                    elif minIndex == 0:
-                        alignLabels.append(AlignLabels.insertion)
-                    elif minIndex == 1:
-                        alignLabels.append(AlignLabels.deletion)
+                if diagPenalty == minDist:
+                    alignLabels.append(match_char)
+                if delPenalty == minDist:
+                    alignLabels.append(AlignLabels.deletion)
+                if insPenalty == minDist:
+                    alignLabels.append(AlignLabels.insertion)
 
                 lev.backMatrix.addBackTrack(
                     index2+1, index1+1, alignLabels, minDist)  # S/C
-                pass
 
         lev.dist = lev.backMatrix.getWeight(
             lev.backMatrix.hyplen, lev.backMatrix.reflen)
         return lev
 
+    @staticmethod
+    def alignBanded(ref, hyp, reserve_list=None, exclusive_sets=None, lowercase=False, weights=None, band=8,
+                    substitution_table=None):
+        '''
+        Like align(), but only fills the cells within band diagonals of the path between the two corners
+        (Ukkonen's cutoff). The band is doubled until no path leaving it can cost as little as the best path
+        inside it, so the backtrack options reachable from the last cell, and therefore editops(), expandAlign()
+        and expandAlignCompact(), are the same as with the full matrix.
+        Assumes non-negative weights. Near-diagonal pairs take O(band * len) time and memory.
+        '''
+        if not weights:
+            weights = Levenshtein.uniformWeights
+        lev = Levenshtein(lowercase=lowercase)
+        lev.s1 = ref
+        lev.s2 = hyp
+
+        if lowercase:
+            ref = [x.lower() for x in ref]
+            hyp = [x.lower() for x in hyp]
+
+        ref_ids, hyp_ids, table = Levenshtein.internTokens(ref, hyp, reserve_list, exclusive_sets, substitution_table)
+
+        hyplen = len(hyp)
+        reflen = len(ref)
+        delta = reflen - hyplen
+        w_d = weights[AlignLabels.deletion]
+        w_i = weights[AlignLabels.insertion]
+
+        k = max(1, band)
+        while True:
+            lo = min(0, delta) - k
+            hi = max(0, delta) + k
+            matrix = BandedBackTrackMatrix(ref_ids, hyp_ids, table, lo, hi, weights)
+            dist = matrix.getWeight(hyplen, reflen)
+
+            # Cheapest conceivable path through the first diagonal outside of the band, on either side:
+            # reaching diagonal t (= j - i) and returning to diagonal delta takes |t| + |delta - t| indels.
+            outside = float('inf')
+            if hi < reflen:
+                t = hi + 1
+                outside = min(outside, t * w_d + (t - delta) * w_i)
+            if lo > -hyplen:
+                t = lo - 1
+                outside = min(outside, -t * w_i + (delta - t) * w_d)
+
+            # Strictly cheaper: no optimal path (and so no reachable backtrack option) leaves the band.
+            if dist < outside:
+                break
+            k *= 2
+
+        lev.backMatrix = matrix
+        lev.band = k
+        lev.dist = dist
+        return lev
+
+    @staticmethod
+    def alignLinear(ref, hyp, reserve_list=None, exclusive_sets=None, lowercase=False, weights=None, base_cells=4096,
+                    substitution_table=None):
+        '''
+        Linear-space (Hirschberg-style) alignment for very long inputs.
+        Returns the same ExpandedAlignment as align() followed by editops() and expandAlign(), using O(len(ref) + len(hyp))
+        memory instead of the full backtrack matrix. Subproblems of at most base_cells cells are solved with align().
+
+        editops() follows the first backtrack option of each cell back from the last one. While sweeping the middle row
+        and the rows below it, every cell carries where that path leaves the middle row, so the split point of the
+        editops() path is known after one forward pass; both halves are then independent, smaller alignments.
+        '''
+        if not weights:
+            weights = Levenshtein.uniformWeights
+        lev = Levenshtein(lowercase=lowercase)
+        lev.s1 = ref
+        lev.s2 = hyp
+
+        if lowercase:
+            ref = [x.lower() for x in ref]
+            hyp = [x.lower() for x in hyp]
+
+        ref_ids, hyp_ids, table = Levenshtein.internTokens(ref, hyp, reserve_list, exclusive_sets, substitution_table)
+
+        w_c = weights[AlignLabels.correct]
+        w_s = weights[AlignLabels.substitution]
+        w_d = weights[AlignLabels.deletion]
+        w_i = weights[AlignLabels.insertion]
+        inf = float('inf')
+
+        def split(r0, r1, h0, h1):
+            '''Finds where the editops() path of ref[r0:r1] x hyp[h0:h1] leaves its middle row.'''
+            reflen = r1 - r0
+            mid = (h1 - h0) // 2
+
+            prev = [j * w_d for j in range(reflen + 1)]
+            prev_cross = None
+            for i in range(1, h1 - h0 + 1):
+                char2 = hyp_ids[h0 + i - 1]
+                sub_row = table.rows[char2] if table.rows is not None else None
+                cur = [i * w_i]
+                # cross[j]: (column, label) of the move out of the middle row on the path ending at (i, j)
+                cross = None
+                if i == mid:
+                    cross = [(0, AlignLabels.insertion)]
+                elif i > mid:
+                    cross = [prev_cross[0]]
+
+                for j in range(1, reflen + 1):
+                    char1 = ref_ids[r0 + j - 1]
+                    ins = prev[j] + w_i
+                    dele = cur[j-1] + w_d
+                    if char1 == char2:
+                        diag = prev[j-1] + w_c
+                        diag_label = AlignLabels.correct
+                    elif sub_row is None or sub_row[char1]:
+                        diag = prev[j-1] + w_s
+                        diag_label = AlignLabels.substitution
+                    else:
+                        diag = inf
+                        diag_label = None
+
+                    best = min(ins, dele, diag)
+                    cur.append(best)
+                    if cross is None:
+                        continue
+
+                    # Same preference as the backtrack options: diagonal, then deletion, then insertion.
+                    if diag == best:
+                        cross.append((j, diag_label) if i == mid else prev_cross[j-1])
+                    elif dele == best:
+                        cross.append(cross[j-1])
+                    else:
+                        cross.append((j, AlignLabels.insertion) if i == mid else prev_cross[j])
+
+                prev = cur
+                prev_cross = cross
+            return mid, prev_cross[reflen]
+
+        def editops(r0, r1, h0, h1):
+            if h1 - h0 <= 1 or (h1 - h0) * (r1 - r0) <= base_cells:
+                sub = Levenshtein.align(ref[r0:r1], hyp[h0:h1], weights=weights, substitution_table=table)
+                return [(op, (i + h0, j + r0)) for op, (i, j) in sub.editops()]
+
+            mid, (col, label) = split(r0, r1, h0, h1)
+            prev_col = col if label == AlignLabels.insertion else col - 1
+            return (editops(r0, r0 + prev_col, h0, h0 + mid - 1) +
+                    [(label, (h0 + mid - 1, r0 + prev_col))] +
+                    editops(r0 + col, r1, h0 + mid, h1))
+
+        lev.edits = editops(0, len(ref), 0, len(hyp))
+        return lev.expandAlign()
+
+    @staticmethod
+    def distance(ref, hyp, lowercase=False):
+        '''
+        Uniform-weight edit distance of ref and hyp (token lists, or strings for a character distance), equal to
+        align(ref, hyp).dist but without an alignment.
+        Bit-parallel (Myers' algorithm in Hyyro's formulation): the vertical deltas of a whole DP column are packed
+        in Python integers over the shorter sequence, so each token of the longer one costs a few integer
+        operations on words of len(shorter) bits, O(ceil(m / w) * n) time.
+        '''
+        if lowercase:
+            ref = [x.lower() for x in ref]
+            hyp = [x.lower() for x in hyp]
+        pattern, text = (ref, hyp) if len(ref) <= len(hyp) else (hyp, ref)
+        m = len(pattern)
+        if m == 0:
+            return len(text)
+
+        # peq[token]: bit k is set if pattern[k] is token
+        peq = {}
+        for k, token in enumerate(pattern):
+            peq[token] = peq.get(token, 0) | (1 << k)
+
+        full = (1 << m) - 1
+        last = 1 << (m - 1)
+        pv = full  # vertical +1 deltas
+        mv = 0     # vertical -1 deltas
+        score = m
+        for token in text:
+            eq = peq.get(token, 0)
+            xv = eq | mv
+            xh = ((((eq & pv) + pv) & full) ^ pv) | eq
+            ph = mv | (~(xh | pv) & full)
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            # The first row of the matrix grows by one per token: a +1 horizontal delta enters at the top.
+            ph = ((ph << 1) | 1) & full
+            mh = (mh << 1) & full
+            pv = mh | (~(xv | ph) & full)
+            mv = ph & xv
+        return score
+
+    @staticmethod
+    def alignCounts(ref, hyp, reserve_list=None, exclusive_sets=None, lowercase=False, weights=None,
+                    substitution_table=None):
+        '''
+        Score-only alignment: returns the (error_rate, score_components) that error_rate() gives for the
+        ExpandedAlignment of align(), editops() and expandAlign(), without storing any backtrack.
+
+        editops() follows the first backtrack option of each cell back from the last one, so the path it finds to
+        a cell extends the path it finds to the preferred predecessor of that cell. Each cell therefore carries
+        its cost and the C/S/D/I counts of that path, and only two rows of the shorter of ref and hyp are kept:
+        O(min(len(ref), len(hyp))) memory.
+        '''
+        if not weights:
+            weights = Levenshtein.uniformWeights
+        if lowercase:
+            ref = [x.lower() for x in ref]
+            hyp = [x.lower() for x in hyp]
+
+        ref_ids, hyp_ids, table = Levenshtein.internTokens(ref, hyp, reserve_list, exclusive_sets, substitution_table)
+
+        w_c = weights[AlignLabels.correct]
+        w_s = weights[AlignLabels.substitution]
+        w_d = weights[AlignLabels.deletion]
+        w_i = weights[AlignLabels.insertion]
+        inf = float('inf')
+        C, S, D, I = range(4)
+
+        # Rows run over the longer sequence and columns over the shorter one. Moving along a row consumes a
+        # column token: a deletion if the columns are ref, an insertion if they are hyp.
+        transposed = len(ref) > len(hyp)
+        if transposed:
+            row_ids, col_ids = ref_ids, hyp_ids
+            w_row, w_col, row_op, col_op = w_d, w_i, D, I
+        else:
+            row_ids, col_ids = hyp_ids, ref_ids
+            w_row, w_col, row_op, col_op = w_i, w_d, I, D
+
+        def step(counts, op):
+            counts = list(counts)
+            counts[op] += 1
+            return tuple(counts)
+
+        prev = [j * w_col for j in range(len(col_ids) + 1)]
+        prev_counts = [(0, 0, 0, 0)]
+        for j in range(len(col_ids)):
+            prev_counts.append(step(prev_counts[-1], col_op))
+
+        for row_id in row_ids:
+            cur = [prev[0] + w_row]
+            cur_counts = [step(prev_counts[0], row_op)]
+            for j, col_id in enumerate(col_ids):
+                # Substitution rules are indexed [hyp][ref]
+                hyp_id, ref_id = (col_id, row_id) if transposed else (row_id, col_id)
+                if hyp_id == ref_id:
+                    diag = prev[j] + w_c
+                    diag_op = C
+                elif table.rows is None or table.rows[hyp_id][ref_id]:
+                    diag = prev[j] + w_s
+                    diag_op = S
+                else:
+                    diag = inf
+                    diag_op = None
+                along_row = prev[j+1] + w_row
+                along_col = cur[j] + w_col
+                best = min(diag, along_row, along_col)
+                cur.append(best)
+
+                # Same preference as the backtrack options: diagonal, then deletion, then insertion.
+                if diag == best:
+                    cur_counts.append(step(prev_counts[j], diag_op))
+                elif (along_row if row_op == D else along_col) == best:
+                    cur_counts.append(step(prev_counts[j+1], D) if row_op == D else step(cur_counts[j], D))
+                else:
+                    cur_counts.append(step(prev_counts[j+1], I) if row_op == I else step(cur_counts[j], I))
+            prev = cur
+            prev_counts = cur_counts
+
+        counts = prev_counts[-1]
+        score_components = {AlignLabels.correct: counts[C], AlignLabels.substitution: counts[S],
+                            AlignLabels.deletion: counts[D], AlignLabels.insertion: counts[I], 'L': len(ref)}
+        if not ref:
+            # No reference. Error is 100%
+            return 1.0, score_components
+        return (counts[S] + counts[D] + counts[I]) / len(ref), score_components
+
+    @staticmethod
+    def anchors(ref, hyp):
+        '''
+        Patience-diff anchors of ref and hyp: of the tokens that occur exactly once in each, the longest chain that
+        is in the same order in both. Returns a list of (ref position, hyp position) pairs.
+        '''
+        ref_count = Counter(ref)
+        hyp_count = Counter(hyp)
+        ref_pos = dict((token, j) for j, token in enumerate(ref) if ref_count[token] == 1)
+        pairs = [(ref_pos[token], i) for i, token in enumerate(hyp) if hyp_count[token] == 1 and token in ref_pos]
+
+        # Longest increasing run of ref positions (pairs are in hyp order), by patience sorting
+        tops = []
+        top_pairs = []
+        back = []
+        for k, (j, i) in enumerate(pairs):
+            pile = bisect.bisect_left(tops, j)
+            back.append(top_pairs[pile-1] if pile else None)
+            if pile == len(tops):
+                tops.append(j)
+                top_pairs.append(k)
+            else:
+                tops[pile] = j
+                top_pairs[pile] = k
+
+        chain = []
+        k = top_pairs[-1] if top_pairs else None
+        while k is not None:
+            chain.append(pairs[k])
+            k = back[k]
+        chain.reverse()
+        return chain
+
+    @staticmethod
+    def alignAnchored(ref, hyp, reserve_list=None, exclusive_sets=None, lowercase=False, weights=None,
+                      substitution_table=None, base_cells=4096, jobs=1, validate=False):
+        '''
+        Divide-and-conquer alignment for long documents. Tokens that occur once in both ref and hyp, in the same
+        order (see anchors()), are aligned as C, which splits the problem into independent alignments between
+        them; parts of more than base_cells cells are split again on the anchors within them. The parts are
+        aligned like align() and editops(), in jobs processes if jobs != 1 (0: one per CPU).
+
+        This is a heuristic: the full DP may find a cheaper alignment that doesn't go through every anchor.
+        With validate=True, the returned ExpandedAlignment has the cost of its path as cost and the cost of the
+        full DP (computed in linear space, see alignCounts) as full_cost, so any divergence can be reported.
+        '''
+        if not weights:
+            weights = Levenshtein.uniformWeights
+        if lowercase:
+            ref_cmp = [x.lower() for x in ref]
+            hyp_cmp = [x.lower() for x in hyp]
+        else:
+            ref_cmp = ref
+            hyp_cmp = hyp
+        kwargs = dict(reserve_list=reserve_list, exclusive_sets=exclusive_sets, lowercase=lowercase,
+                      weights=weights, substitution_table=substitution_table)
+
+        # In order: (r0, r1, h0, h1) parts to align, and the edits of the anchors between them
+        pieces = []
+
+        def split(r0, r1, h0, h1):
+            found = Levenshtein.anchors(ref_cmp[r0:r1], hyp_cmp[h0:h1]) if (r1 - r0) * (h1 - h0) > base_cells else []
+            if not found:
+                pieces.append((r0, r1, h0, h1))
+                return
+            prev_r, prev_h = r0, h0
+            for j, i in found:
+                split(prev_r, r0 + j, prev_h, h0 + i)
+                pieces.append([(AlignLabels.correct, (h0 + i, r0 + j))])
+                prev_r, prev_h = r0 + j + 1, h0 + i + 1
+            split(prev_r, r1, prev_h, h1)
+
+        split(0, len(ref), 0, len(hyp))
+
+        parts = [piece for piece in pieces if isinstance(piece, tuple)]
+        tasks = [(ref[r0:r1], hyp[h0:h1], kwargs) for r0, r1, h0, h1 in parts]
+        if jobs != 1 and len(tasks) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs or None)
+            try:
+                solved = pool.map(_partEditops, tasks)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            solved = [_partEditops(task) for task in tasks]
+        solved = dict(zip(parts, solved))
+
+        edits = []
+        for piece in pieces:
+            if isinstance(piece, list):
+                edits.extend(piece)
+            else:
+                r0, r1, h0, h1 = piece
+                edits.extend((op, (i + h0, j + r0)) for op, (i, j) in solved[piece])
+
+        lev = Levenshtein(lowercase=lowercase)
+        lev.s1 = ref
+        lev.s2 = hyp
+        lev.edits = edits
+        alignment = lev.expandAlign()
+        if validate and alignment is not None:
+            alignment.cost = sum(weights[op] for op, _ in edits)
+            _, components = Levenshtein.alignCounts(ref, hyp, **kwargs)
+            alignment.full_cost = sum(weights[label] * components[label] for label in AlignLabels.validOptions)
+        return alignment
+
+    @staticmethod
+    def expandedAlign(ref, hyp, mode=AlignMode.Full, engine=AlignEngine.Python, **kwargs):
+        '''
+        Aligns ref and hyp and returns the ExpandedAlignment of the editops() path.
+        mode (see AlignMode) trades speed and memory; the alignment is the same for all modes but Anchored.
+        '''
+        if mode == AlignMode.Anchored:
+            return Levenshtein.alignAnchored(ref, hyp, **kwargs)
+        elif mode == AlignMode.Linear:
+            align = Levenshtein.alignLinear
+        elif mode == AlignMode.Banded:
+            align = Levenshtein.alignBanded
+        elif mode == AlignMode.Full:
+            def align(ref, hyp, **kwargs):
+                return Levenshtein.align(ref, hyp, engine=engine, **kwargs)
+        else:
+            raise ValueError("Unknown alignment mode: %s" % mode)
+
+        if Levenshtein.trimmable(kwargs.get('weights')) and not kwargs.get('dist_penalty_set') and (ref or hyp):
+            lev = Levenshtein.trimmedEditops(ref, hyp, None if mode == AlignMode.Linear else align, **kwargs)
+            if lev is not None:
+                return lev.expandAlign()
+        if mode == AlignMode.Linear:
+            return align(ref, hyp, **kwargs)
+        lev = align(ref, hyp, **kwargs)
+        lev.editops()
+        return lev.expandAlign()
+
+    @staticmethod
+    def trimmable(weights):
+        '''
+        Whether matching tokens at the start or end of a pair are always on the editops() path: true if correct
+        alignments are free and no weight is negative. Matching the last tokens then costs no more than any path
+        that doesn't, and editops() prefers the diagonal on ties.
+        '''
+        if not weights:
+            weights = Levenshtein.uniformWeights
+        return weights[AlignLabels.correct] == 0 and min(weights.values()) >= 0
+
+    @staticmethod
+    def trimmedEditops(ref, hyp, align, lowercase=False, **kwargs):
+        '''
+        Computes the editops() path of ref and hyp while only aligning the part between their common prefix and
+        suffix (for trimmable() weights). Returns a Levenshtein with its edits set, ready for expandAlign().
+        align(ref, hyp, **kwargs) aligns the middle part; if align is None, only identical pairs are handled
+        (None is returned for others).
+
+        The common suffix is always aligned as C. The costs of the cells past the common prefix don't depend on
+        it, so the path through the middle is the same as in the full matrix; but if it reaches the first row or
+        column of the middle part before its corner, the path may cross into the prefix. It then continues on
+        the alignment of the prefix block the path is left with.
+        '''
+        lev = Levenshtein(lowercase=lowercase)
+        lev.s1 = ref
+        lev.s2 = hyp
+        if lowercase:
+            ref_cmp = [x.lower() for x in ref]
+            hyp_cmp = [x.lower() for x in hyp]
+        else:
+            ref_cmp = ref
+            hyp_cmp = hyp
+        reflen = len(ref)
+        hyplen = len(hyp)
+
+        if ref_cmp == hyp_cmp:
+            # Identical segment: all C
+            lev.edits = [(AlignLabels.correct, (k, k)) for k in range(reflen)]
+            return lev
+        if align is None:
+            return None
+
+        shortest = min(reflen, hyplen)
+        suffix = 0
+        while suffix < shortest and ref_cmp[reflen-1-suffix] == hyp_cmp[hyplen-1-suffix]:
+            suffix += 1
+        prefix = 0
+        while prefix < shortest - suffix and ref_cmp[prefix] == hyp_cmp[prefix]:
+            prefix += 1
+        tail = [(AlignLabels.correct, (hyplen - suffix + k, reflen - suffix + k)) for k in range(suffix)]
+
+        middle = align(ref[prefix:reflen-suffix], hyp[prefix:hyplen-suffix], lowercase=lowercase, **kwargs)
+        matrix = middle.backMatrix
+        i = matrix.hyplen
+        j = matrix.reflen
+        back = []
+        while (i > 0 and j > 0) or (prefix == 0 and (i > 0 or j > 0)):
+            op = matrix.getBackTrackOffset(i, j)
+            off_i, off_j = op[1]
+            i += off_i
+            j += off_j
+            back.append((op[0], (i + prefix, j + prefix)))
+        back.reverse()
+
+        if i == 0 and j == 0:
+            head = [(AlignLabels.correct, (k, k)) for k in range(prefix)]
+        else:
+            # The path left the middle part on its first row or column, away from the corner
+            head = align(ref[:prefix+j], hyp[:prefix+i], lowercase=lowercase, **kwargs).editops()
+        lev.edits = head + back + tail
+        return lev
+
+    @staticmethod
+    def internTokens(ref, hyp, reserve_list=None, exclusive_sets=None, substitution_table=None):
+        '''
+        Interns ref and hyp as integer ids in substitution_table, or in a table built for this pair from
+        reserve_list and exclusive_sets. Returns (ref_ids, hyp_ids, table).
+        '''
+        table = substitution_table
+        if table is None:
+            table = SubstitutionTable(reserve_list, exclusive_sets)
+        return table.internTokens(ref), table.internTokens(hyp), table
+
     def matchPositions(self, token, token2=None, min_i=None, min_j=None, max_i=None, max_j=None):
         if not min_i:
             min_i = 0
@@ -385,13 +1325,17 @@ class Levenshtein:
         chart.appendleft(maxPos)
 
         G = nx.Graph()
+        visited = set()
 
         while chart:
             (i, j) = chart.pop()
+            # Cells are reached once per best path through them; their edges only need adding once.
+            if (i, j) in visited:
+                continue
+            visited.add((i, j))
 
-            for alignLabel in self.backMatrix.matrix[i][j].backTrackOptions:
-                child = self.backMatrix.matrix[i][j].getBackTrackOffset(
-                    alignLabel)
+            for alignLabel in self.backMatrix.getBackTrackOptions(i, j):
+                child = self.backMatrix.getBackTrackOffset(i, j, alignLabel)
                 prev_i = i + child[1][0]
                 prev_j = j + child[1][1]
 
@@ -418,7 +1362,7 @@ class Levenshtein:
         back = []
 
         while i > 0 or j > 0:
-            op = self.backMatrix.matrix[i][j].getBackTrackOffset()
+            op = self.backMatrix.getBackTrackOffset(i, j)
             off_i, off_j = op[1]
             i += off_i
             j += off_j
@@ -473,22 +1417,72 @@ class Levenshtein:
 
         return ExpandedAlignment(s1, s2, align, s1_map, s2_map, lowercase=self.lowercase)
 
+    def bestPath(self, minPos=None, maxPos=None):
+        '''
+        Among all of the best Levenshtein alignment backtrack paths, finds one with the fewest edges off the hull
+        of minPos and maxPos (the same weighting as bestPathsGraph), with a DP over the backtrack lattice.
+        Ties are broken like editops(), preferring C/S, then D, then I when walking back from maxPos.
+        Returns the path as a list of (rlabel, hlabel, align) tuples from minPos to maxPos.
+        '''
+        if not minPos:
+            minPos = (0, 0)
+        if not maxPos:
+            maxPos = (self.backMatrix.hyplen, self.backMatrix.reflen)
+        hull_i = (minPos[0], maxPos[0])
+        hull_j = (minPos[1], maxPos[1])
+
+        # Collect the lattice of cells on some best path, with their (label, predecessor, weight) edges.
+        edges = {}
+        stack = [maxPos]
+        while stack:
+            (i, j) = stack.pop()
+            if (i, j) in edges or (i, j) == minPos:
+                continue
+            options = []
+            for alignLabel in self.backMatrix.getBackTrackOptions(i, j):
+                child = self.backMatrix.getBackTrackOffset(i, j, alignLabel)
+                prev_i = i + child[1][0]
+                prev_j = j + child[1][1]
+                weight = 1
+                if (i == prev_i and i in hull_i) or (j == prev_j and j in hull_j):
+                    weight = 0
+                options.append((child[0], (prev_i, prev_j), weight))
+                stack.append((prev_i, prev_j))
+            edges[(i, j)] = options
+
+        # Predecessors always precede a cell in row-major order.
+        cost = {minPos: 0}
+        for cell in sorted(edges):
+            cost[cell] = min(cost[prev] + weight for _, prev, weight in edges[cell])
+
+        path = []
+        (i, j) = maxPos
+        while (i, j) != minPos:
+            best = cost[(i, j)]
+            for align, prev, weight in edges[(i, j)]:
+                if cost[prev] + weight == best:
+                    break
+            rlabel = self.s1[j-1] if prev[1] < j else ''
+            hlabel = self.s2[i-1] if prev[0] < i else ''
+            path.append((rlabel, hlabel, align))
+            (i, j) = prev
+        path.reverse()
+        return path
+
     def expandAlignCompact(self, minPos=None, maxPos=None):
         """
-        Using the backtracking matrix, finds all of the paths with the minimum Levenshtein distance score and stores them in a graph.
-        Then, it returns the expanded alignment of the shortest path in the graph (which still has the same minimum Lev distance score.
+        Using the backtracking matrix, finds all of the paths with the minimum Levenshtein distance score.
+        Then, it returns the expanded alignment of the shortest one (see bestPath), which still has the same minimum Lev distance score.
         """
-        import networkx as nx
         minPos = (0, 0)
         maxPos = (self.backMatrix.hyplen, self.backMatrix.reflen)
 
-        G = self.bestPathsGraph(minPos, maxPos)
-        path = nx.shortest_path(
-            G, source=minPos, target=maxPos, weight='weight')
+        path = self.bestPath(minPos, maxPos)
 
         # Expand the best path into the Levenshtein alignment.
-        s1_align, s2_align, align = [list(a) for a in zip(
-            *(G[u][v]['labels'] for (u, v) in zip(path[0:], path[1:])))]
+        s1_align = [rlabel for rlabel, _, _ in path]
+        s2_align = [hlabel for _, hlabel, _ in path]
+        align = [label for _, _, label in path]
         return ExpandedAlignment(s1_align, s2_align, align, lowercase=self.lowercase)
 
     @staticmethod
@@ -496,6 +1490,16 @@ class Levenshtein:
         return (s + d + i) / reflength
 
 
+def _partEditops(task):
+    '''editops() of a (ref, hyp, kwargs) part of Levenshtein.alignAnchored; a function, so it can run in a worker process.'''
+    ref, hyp, kwargs = task
+    if not ref and not hyp:
+        return []
+    if Levenshtein.trimmable(kwargs.get('weights')):
+        return Levenshtein.trimmedEditops(ref, hyp, Levenshtein.align, **kwargs).edits
+    return Levenshtein.align(ref, hyp, **kwargs).editops()
+
+
 class BackTrackMatrix:
     def __init__(self, reflen, hyplen, weights=Levenshtein.uniformWeights):
         self.reflen = reflen
@@ -526,6 +1530,12 @@ class BackTrackMatrix:
     def backTrackOptions(self, i, j):
         return self.matrix[i][j]
 
+    def getBackTrackOptions(self, i, j):
+        return self.matrix[i][j].backTrackOptions
+
+    def getBackTrackOffset(self, i, j, alignLabel=None):
+        return self.matrix[i][j].getBackTrackOffset(alignLabel)
+
     def getWeight(self, i, j):
         return self.matrix[i][j].weight
 
@@ -568,3 +1578,231 @@ class BackTrackSlot:
         else:
             offset = (-1, 0)
         return (alignLabel, offset)
+
+
+class BitmaskBackTrackMatrix:
+    '''
+    Base for backtrack matrices that pack the options of each cell into a bitmask instead of a BackTrackSlot.
+    Subclasses implement getBackTrackBits() and getWeight().
+    '''
+    # Bitmask flags, listed in the order BackTrackMatrix records its options.
+    labelBits = ((AlignLabels.correct, 1), (AlignLabels.substitution, 2),
+                 (AlignLabels.deletion, 4), (AlignLabels.insertion, 8))
+
+    def getBackTrackBits(self, i, j):
+        raise NotImplementedError
+
+    def getBackTrackOptions(self, i, j):
+        bits = self.getBackTrackBits(i, j)
+        return [label for label, bit in BitmaskBackTrackMatrix.labelBits if bits & bit]
+
+    def getBackTrackOffset(self, i, j, alignLabel=None):
+        options = self.getBackTrackOptions(i, j)
+        if alignLabel:
+            # Make sure it exists
+            if alignLabel not in AlignLabels.validOptions:
+                raise Exception("Invalid backtrack option: %s" % alignLabel)
+            if alignLabel not in options:
+                raise Exception("Illegal backtrack option: %s" % alignLabel)
+        else:
+            # Just arbitrarily grab the first item
+            alignLabel = options[0]
+
+        offset = None
+        if alignLabel in (AlignLabels.correct, AlignLabels.substitution):
+            offset = (-1, -1)
+        elif alignLabel == AlignLabels.deletion:
+            offset = (0, -1)
+        else:
+            offset = (-1, 0)
+        return (alignLabel, offset)
+
+
+class BandedBackTrackMatrix(BitmaskBackTrackMatrix):
+    '''
+    Backtrack matrix restricted to the diagonals lo <= j - i <= hi.
+    Each row only stores its band: costs in a list, backtrack options as a bytearray of bitmasks.
+    Cells outside of the band have an infinite weight and no options.
+    '''
+
+    def __init__(self, ref_ids, hyp_ids, table, lo, hi, weights=Levenshtein.uniformWeights):
+        self.reflen = len(ref_ids)
+        self.hyplen = len(hyp_ids)
+        self.weights = weights
+        self.lo = lo
+        self.hi = hi
+
+        w_c = weights[AlignLabels.correct]
+        w_s = weights[AlignLabels.substitution]
+        w_d = weights[AlignLabels.deletion]
+        w_i = weights[AlignLabels.insertion]
+        inf = float('inf')
+
+        self.starts = []
+        self.costs = []
+        self.bits = []
+        for i in range(self.hyplen + 1):
+            start = max(0, i + lo)
+            end = min(self.reflen, i + hi)
+            row_cost = []
+            row_bits = bytearray()
+
+            if i == 0:
+                for j in range(start, end + 1):
+                    row_cost.append(j * w_d)
+                    row_bits.append(4 if j else 0)
+            else:
+                prev_cost = self.costs[i-1]
+                prev_start = self.starts[i-1]
+                prev_end = prev_start + len(prev_cost) - 1
+                char2 = hyp_ids[i-1]
+                sub_row = table.rows[char2] if table.rows is not None else None
+
+                for j in range(start, end + 1):
+                    if j == 0:
+                        row_cost.append(i * w_i)
+                        row_bits.append(8)
+                        continue
+
+                    ins = prev_cost[j - prev_start] + w_i if j <= prev_end else inf
+                    dele = row_cost[-1] + w_d if j > start else inf
+
+                    char1 = ref_ids[j-1]
+                    if char1 == char2:
+                        diag = prev_cost[j - 1 - prev_start] + w_c
+                        diag_bit = 1
+                    elif sub_row is None or sub_row[char1]:
+                        diag = prev_cost[j - 1 - prev_start] + w_s
+                        diag_bit = 2
+                    else:
+                        diag = inf
+                        diag_bit = 0
+
+                    best = min(ins, dele, diag)
+                    row_cost.append(best)
+                    row_bits.append((diag_bit if diag == best else 0) |
+                                    (4 if dele == best else 0) |
+                                    (8 if ins == best else 0))
+
+            self.starts.append(start)
+            self.costs.append(row_cost)
+            self.bits.append(row_bits)
+
+    def getBackTrackBits(self, i, j):
+        k = j - self.starts[i]
+        if 0 <= k < len(self.bits[i]):
+            return self.bits[i][k]
+        return 0
+
+    def getWeight(self, i, j):
+        k = j - self.starts[i]
+        if 0 <= k < len(self.costs[i]):
+            return self.costs[i][k]
+        return float('inf')
+
+
+class NumpyBackTrackMatrix(BitmaskBackTrackMatrix):
+    '''
+    Array-backed alternative to BackTrackMatrix.
+    Costs live in an integer (or float, for fractional weights) matrix and the backtrack options of each cell
+    are packed into a uint8 bitmask, so filling the matrix allocates no per-cell Python objects.
+    '''
+
+    def __init__(self, ref_ids, hyp_ids, table, weights=Levenshtein.uniformWeights):
+        import numpy as np
+
+        self.reflen = len(ref_ids)
+        self.hyplen = len(hyp_ids)
+        self.weights = weights
+
+        w_c = weights[AlignLabels.correct]
+        w_s = weights[AlignLabels.substitution]
+        w_d = weights[AlignLabels.deletion]
+        w_i = weights[AlignLabels.insertion]
+
+        integral = all(isinstance(w, int) for w in (w_c, w_s, w_d, w_i))
+        dtype = np.int64 if integral else np.float64
+        # Cost of forbidden substitutions; large enough to never be a minimum, small enough not to overflow.
+        forbidden = np.iinfo(np.int64).max // 4 if integral else np.inf
+
+        self.cost = np.zeros((self.hyplen + 1, self.reflen + 1), dtype=dtype)
+        self.back = np.zeros((self.hyplen + 1, self.reflen + 1), dtype=np.uint8)
+
+        # Initialize the first column and row.
+        self.cost[:, 0] = np.arange(self.hyplen + 1) * w_i
+        self.cost[0, :] = np.arange(self.reflen + 1) * w_d
+        self.back[1:, 0] = 8
+        self.back[0, 1:] = 4
+
+        if not (self.hyplen and self.reflen):
+            return
+
+        # Token-pair tables: which cells match, and what the diagonal move costs.
+        ref_ids = np.array(ref_ids)
+        hyp_ids = np.array(hyp_ids)
+        masks = np.array(table.masks, dtype=np.int64)
+
+        match = hyp_ids[:, None] == ref_ids[None, :]
+        allowed = (masks[hyp_ids][:, None] & masks[ref_ids][None, :]) != 0
+        diag_cost = np.where(match, w_c, np.where(allowed, w_s, forbidden)).astype(dtype)
+        diag_bits = np.where(match, 1, 2).astype(np.uint8)
+
+        if integral:
+            self._fillRows(diag_cost, diag_bits, w_d, w_i)
+        else:
+            self._fillDiagonals(diag_cost, diag_bits, w_d, w_i)
+
+    def _fillRows(self, diag_cost, diag_bits, w_d, w_i):
+        '''
+        Row-wise fill. Deletions chain along a row, so the row minimum is resolved with a running minimum:
+        cost[j] = min_k<=j (best[k] + (j-k) * w_d). Exact for integer weights.
+        '''
+        import numpy as np
+
+        cost = self.cost
+        back = self.back
+        steps = np.arange(self.reflen + 1) * w_d
+
+        for i in range(1, self.hyplen + 1):
+            prev = cost[i-1]
+            ins = prev[1:] + w_i
+            diag = prev[:-1] + diag_cost[i-1]
+            best = np.minimum(ins, diag)
+
+            row = np.empty_like(prev)
+            row[0] = cost[i, 0]
+            row[1:] = best
+            row = np.minimum.accumulate(row - steps) + steps
+            cost[i, 1:] = row[1:]
+
+            dele = row[:-1] + w_d
+            cur = row[1:]
+            back[i, 1:] = (np.where(diag == cur, diag_bits[i-1], 0) |
+                           np.where(dele == cur, 4, 0) |
+                           np.where(ins == cur, 8, 0))
+
+    def _fillDiagonals(self, diag_cost, diag_bits, w_d, w_i):
+        '''Anti-diagonal fill: every cell of a diagonal only depends on the two previous diagonals.'''
+        import numpy as np
+
+        cost = self.cost
+        back = self.back
+        for d in range(2, self.hyplen + self.reflen + 1):
+            ii = np.arange(max(1, d - self.reflen), min(self.hyplen, d - 1) + 1)
+            jj = d - ii
+
+            ins = cost[ii-1, jj] + w_i
+            dele = cost[ii, jj-1] + w_d
+            diag = cost[ii-1, jj-1] + diag_cost[ii-1, jj-1]
+            best = np.minimum(np.minimum(ins, dele), diag)
+
+            cost[ii, jj] = best
+            back[ii, jj] = (np.where(diag == best, diag_bits[ii-1, jj-1], 0) |
+                            np.where(dele == best, 4, 0) |
+                            np.where(ins == best, 8, 0))
+
+    def getBackTrackBits(self, i, j):
+        return int(self.back[i, j])
+
+    def getWeight(self, i, j):
+        return self.cost[i, j].item()
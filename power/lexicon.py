@@ -0,0 +1,219 @@
+'''
+Compiled pronunciation lexicons.
+
+A compiled lexicon stores the sorted lexicon keys and their pronunciations as packed UTF-8 strings,
+so it can be memory-mapped and searched lazily instead of parsing a JSON dict on startup.
+Every process mapping the same file shares its physical pages.
+
+Layout (little-endian):
+    magic     8 bytes    b'POWERLEX'
+    version   uint32
+    count     uint32     number of entries N
+    key_offs  uint32 * (N+1), relative to the start of the key blob
+    val_offs  uint32 * (N+1), relative to the start of the value blob
+    key blob  UTF-8 keys, sorted bytewise
+    val blob  UTF-8 pronunciations, in key order
+'''
+import sys
+import json
+import bisect
+import hashlib
+import mmap
+import struct
+
+MAGIC = b'POWERLEX'
+VERSION = 1
+
+_header = struct.Struct('<8sII')
+_offset = struct.Struct('<I')
+
+
+def compile_lexicon(lexicon, filepath):
+    '''Writes a key/value pronunciation dict as a compiled lexicon file.'''
+    items = sorted((k.encode('utf-8'), v.encode('utf-8')) for k, v in lexicon.items())
+
+    key_offsets = [0]
+    val_offsets = [0]
+    for key, val in items:
+        key_offsets.append(key_offsets[-1] + len(key))
+        val_offsets.append(val_offsets[-1] + len(val))
+
+    with open(filepath, 'wb') as f:
+        f.write(_header.pack(MAGIC, VERSION, len(items)))
+        f.write(struct.pack('<%dI' % len(key_offsets), *key_offsets))
+        f.write(struct.pack('<%dI' % len(val_offsets), *val_offsets))
+        f.write(b''.join(key for key, _ in items))
+        f.write(b''.join(val for _, val in items))
+
+
+def is_compiled_lexicon(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def lexicon_fingerprint(filepath):
+    '''SHA-1 of a lexicon file, to key anything derived from its contents.'''
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_lexicon(filepath):
+    '''Opens a compiled lexicon lazily, or reads a JSON key/value lexicon into a dict.'''
+    if is_compiled_lexicon(filepath):
+        return CompiledLexicon(filepath)
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+
+def _prefix_end(prefix):
+    '''
+    Smallest string (or bytes) greater than every string starting with prefix, or None if prefix ends with the
+    largest code point (within the range of keys sharing prefix[:-1], every key >= prefix then starts with it).
+    '''
+    if isinstance(prefix, bytes):
+        # UTF-8 never uses the byte 0xff, so the last byte can always be incremented.
+        return prefix[:-1] + bytes([prefix[-1] + 1])
+    if ord(prefix[-1]) == sys.maxunicode:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _longest_prefix(word, start, bisect_range, key_at, value_at, count, encode=False):
+    '''
+    Longest non-empty key that word[start:] starts with, as (end, value), or None. Keys are sorted; each character
+    of word narrows the index range [lo, hi) of keys sharing the current prefix, in a single walk along word.
+    '''
+    lo, hi = 0, count
+    best = None
+    prefix = word[:0].encode('utf-8') if encode else word[:0]
+    for end in range(start + 1, len(word) + 1):
+        char = word[end-1]
+        prefix += char.encode('utf-8') if encode else char
+        lo = bisect_range(prefix, lo, hi)
+        prefix_end = _prefix_end(prefix)
+        if prefix_end is not None:
+            hi = bisect_range(prefix_end, lo, hi)
+        if lo >= hi:
+            break
+        if key_at(lo) == prefix:
+            best = (end, lo)
+    if best is None:
+        return None
+    return best[0], value_at(best[1])
+
+
+class SortedKeyIndex(object):
+    '''Longest-prefix search over the keys of a key/value lexicon dict.'''
+
+    def __init__(self, lexicon):
+        self.lexicon = lexicon
+        self.keys = sorted(lexicon)
+
+    def longest_prefix(self, word, start=0):
+        '''Longest non-empty lexicon key that word[start:] starts with, as (end, pronunciation), or None.'''
+        return _longest_prefix(word, start, lambda key, lo, hi: bisect.bisect_left(self.keys, key, lo, hi),
+                               self.keys.__getitem__, lambda i: self.lexicon[self.keys[i]], len(self.keys))
+
+
+class CompiledLexicon(object):
+    '''Read-only, dict-like view of a memory-mapped compiled lexicon.'''
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = _header.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise Exception("Not a compiled lexicon: {0}".format(filepath))
+        if version != VERSION:
+            raise Exception("Unsupported compiled lexicon version {0}: {1}".format(version, filepath))
+
+        self._count = count
+        self._key_offsets = _header.size
+        self._val_offsets = self._key_offsets + _offset.size * (count + 1)
+        self._key_blob = self._val_offsets + _offset.size * (count + 1)
+        self._val_blob = self._key_blob + self._offset(self._key_offsets, count)
+
+    def _offset(self, table, i):
+        return _offset.unpack_from(self._mm, table + _offset.size * i)[0]
+
+    def _key(self, i):
+        start = self._key_blob + self._offset(self._key_offsets, i)
+        end = self._key_blob + self._offset(self._key_offsets, i + 1)
+        return self._mm[start:end]
+
+    def _value(self, i):
+        start = self._val_blob + self._offset(self._val_offsets, i)
+        end = self._val_blob + self._offset(self._val_offsets, i + 1)
+        return self._mm[start:end].decode('utf-8')
+
+    def _bisect(self, key, lo=0, hi=None):
+        '''Index of the first entry whose key is >= key (as UTF-8 bytes).'''
+        if hi is None:
+            hi = self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, word):
+        key = word.encode('utf-8')
+        i = self._bisect(key)
+        if i < self._count and self._key(i) == key:
+            return i
+        return -1
+
+    def longest_prefix(self, word, start=0):
+        '''Longest non-empty lexicon key that word[start:] starts with, as (end, pronunciation), or None.'''
+        return _longest_prefix(word, start, self._bisect, self._key, self._value, self._count, encode=True)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, word):
+        return self._find(word) >= 0
+
+    def __getitem__(self, word):
+        i = self._find(word)
+        if i < 0:
+            raise KeyError(word)
+        return self._value(i)
+
+    def get(self, word, default=None):
+        i = self._find(word)
+        return self._value(i) if i >= 0 else default
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._key(i).decode('utf-8')
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for i in range(self._count):
+            yield self._key(i).decode('utf-8'), self._value(i)
+
+    def close(self):
+        self._mm.close()
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python -m power.lexicon <lexicon.json> <lexicon.bin>")
+        return 1
+    with open(argv[0], 'r') as f:
+        lexicon = json.load(f)
+    compile_lexicon(lexicon, argv[1])
+    print('File written to {}'.format(argv[1]))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,267 @@
+'''
+Oracle WER and POWER over n-best lists.
+
+The entries of a segment's n-best list are aligned against the reference in sorted order, a depth-first walk of
+their prefix trie, so the DP row of a prefix shared by several entries is computed once:
+- with the word alignment weights, carrying the C/S/D/I counts of the path that the WER alignment takes (as
+  Levenshtein.alignCounts does), so the WER oracle is known without aligning any entry in full;
+- with indel weights, which give the longest common subsequence of each entry and the reference. Every C of an
+  alignment pairs equal words, so an entry has at least max(ref words, hyp words) - LCS errors.
+The POWER alignment needs the phones, so entries are aligned in full in order of that lower bound, until no other
+entry can have fewer POWER errors than the best one found.
+'''
+from power.aligner import PowerAligner
+from power.levenshtein import AlignLabels, AlignMode, Levenshtein
+from power.pipeline import ScoredSegment, SegmentScorer
+
+# Substitutions cost as much as a deletion and an insertion: the distance is ref + hyp - 2 LCS.
+indelWeights = {AlignLabels.correct: 0, AlignLabels.substitution: 2, AlignLabels.deletion: 1,
+                AlignLabels.insertion: 1}
+
+
+def read_nbest(f_nbest):
+    '''
+    Yields (segment id, hyplines) for each segment of an n-best list in Moses format, one
+    "id ||| hypothesis ||| features ||| score" entry per line, grouped by id in file order.
+    '''
+    segid = None
+    hyplines = []
+    for line in f_nbest:
+        fields = line.split('|||')
+        if len(fields) < 2:
+            raise ValueError("Not an n-best entry (id ||| hypothesis ||| ...): {0}".format(line.strip()))
+        entry_id = int(fields[0])
+        if entry_id != segid:
+            if segid is not None:
+                yield segid, hyplines
+            segid = entry_id
+            hyplines = []
+        hyplines.append(fields[1].strip())
+    if segid is not None:
+        yield segid, hyplines
+
+
+def read_nbest_segments(f_ref, f_nbest):
+    '''
+    Yields stripped (refline, hyplines) pairs. Line k of the reference (from 0) matches the n-best entries with id k;
+    a segment without entries has a single blank hypothesis.
+    '''
+    entries = read_nbest(f_nbest)
+    head = next(entries, None)
+    for segid, refline in enumerate(f_ref):
+        while head is not None and head[0] < segid:
+            head = next(entries, None)
+        if head is not None and head[0] == segid:
+            yield refline.strip(), tuple(head[1])
+        else:
+            yield refline.strip(), ('',)
+
+
+def prefix_order(hyps):
+    '''
+    Yields (k, shared) for the hypotheses in hyps (lists of tokens) in sorted order, a depth-first walk of their
+    prefix trie: shared is the length of the prefix that hyps[k] shares with the hypothesis before it.
+    '''
+    path = []
+    for k in sorted(range(len(hyps)), key=lambda k: hyps[k]):
+        hyp = hyps[k]
+        shared = 0
+        limit = min(len(path), len(hyp))
+        while shared < limit and path[shared] == hyp[shared]:
+            shared += 1
+        path = hyp
+        yield k, shared
+
+
+def prefix_costs(ref, hyps, weights=None):
+    '''
+    Word alignment cost of each hypothesis in hyps (lists of tokens) against ref, equal to the distance of
+    Levenshtein.align(ref, hyp, weights=weights).
+    The hypotheses are visited in prefix_order: consecutive hypotheses share the DP rows of their common prefix,
+    and only the rows of the rest are computed.
+    Returns (costs, rows), where rows is the number of DP rows computed.
+    '''
+    if not weights:
+        weights = Levenshtein.uniformWeights
+    w_c = weights[AlignLabels.correct]
+    w_s = weights[AlignLabels.substitution]
+    w_d = weights[AlignLabels.deletion]
+    w_i = weights[AlignLabels.insertion]
+
+    # stack[n] is the DP row of the first n tokens of the current hypothesis (the hyp x ref matrix row of
+    # Levenshtein.align)
+    stack = [[j * w_d for j in range(len(ref) + 1)]]
+    costs = [None] * len(hyps)
+    rows = 0
+    for k, shared in prefix_order(hyps):
+        del stack[shared + 1:]
+        for token in hyps[k][shared:]:
+            prev_row = stack[-1]
+            cur_row = [prev_row[0] + w_i]
+            for j, ref_token in enumerate(ref):
+                diag = prev_row[j] + (w_c if ref_token == token else w_s)
+                cur_row.append(min(diag, prev_row[j+1] + w_i, cur_row[j] + w_d))
+            stack.append(cur_row)
+        rows += len(hyps[k]) - shared
+        costs[k] = stack[-1][-1]
+    return costs, rows
+
+
+def prefix_counts(ref, hyps, weights=None):
+    '''
+    Like prefix_costs, but each cell also carries the (C, S, D, I) counts of the path that editops() finds to it,
+    as in Levenshtein.alignCounts. Returns (costs, counts, rows), where counts[k] are the counts of hyps[k].
+    '''
+    if not weights:
+        weights = Levenshtein.uniformWeights
+    w_c = weights[AlignLabels.correct]
+    w_s = weights[AlignLabels.substitution]
+    w_d = weights[AlignLabels.deletion]
+    w_i = weights[AlignLabels.insertion]
+
+    stack = [([j * w_d for j in range(len(ref) + 1)], [(0, 0, j, 0) for j in range(len(ref) + 1)])]
+    costs = [None] * len(hyps)
+    counts = [None] * len(hyps)
+    rows = 0
+    for k, shared in prefix_order(hyps):
+        del stack[shared + 1:]
+        for token in hyps[k][shared:]:
+            prev_row, prev_counts = stack[-1]
+            c, s, d, i = prev_counts[0]
+            cur_row = [prev_row[0] + w_i]
+            cur_counts = [(c, s, d, i + 1)]
+            for j, ref_token in enumerate(ref):
+                correct = ref_token == token
+                diag = prev_row[j] + (w_c if correct else w_s)
+                deletion = cur_row[j] + w_d
+                insertion = prev_row[j+1] + w_i
+                best = min(diag, deletion, insertion)
+                cur_row.append(best)
+                # Same preference as the backtrack options: diagonal, then deletion, then insertion.
+                if diag == best:
+                    c, s, d, i = prev_counts[j]
+                    cur_counts.append((c + 1, s, d, i) if correct else (c, s + 1, d, i))
+                elif deletion == best:
+                    c, s, d, i = cur_counts[j]
+                    cur_counts.append((c, s, d + 1, i))
+                else:
+                    c, s, d, i = prev_counts[j+1]
+                    cur_counts.append((c, s, d, i + 1))
+            stack.append((cur_row, cur_counts))
+        rows += len(hyps[k]) - shared
+        costs[k] = stack[-1][0][-1]
+        counts[k] = stack[-1][1][-1]
+    return costs, counts, rows
+
+
+def best_entry(order, bounds, errors_of):
+    '''
+    The entry k with the fewest errors_of(k) (the first in order on ties), where order is sorted by (bounds[k], k)
+    and bounds[k] <= errors_of(k). errors_of is only called until no later entry can do better.
+    '''
+    best = None
+    for k in order:
+        if best is not None and (bounds[k], k) >= best:
+            break
+        entry = (errors_of(k), k)
+        if best is None or entry < best:
+            best = entry
+    return best[1]
+
+
+def errors(components):
+    return components['S'] + components['D'] + components['I']
+
+
+class NbestChoice(object):
+    '''
+    Which entries of a segment's n-best list are its WER and POWER oracles (their positions in the list, from 0),
+    with the work done to find them.
+    '''
+    def __init__(self, size, wer_rank, power_rank, wer_hyp, power_hyp, rows, words, aligned):
+        self.size = size
+        self.wer_rank = wer_rank
+        self.power_rank = power_rank
+        self.wer_hyp = wer_hyp
+        self.power_hyp = power_hyp
+        # DP rows computed by the prefix walks, and the rows that the same walks over each entry separately would
+        # compute
+        self.rows = rows
+        self.words = words
+        # Entries aligned in full (WER and POWER)
+        self.aligned = aligned
+
+
+class NbestScorer(SegmentScorer):
+    '''
+    Scores (refline, hyplines) segments of n-best lists: returns a ScoredSegment with the WER results of the
+    WER oracle and the POWER results of the POWER oracle, and their NbestChoice as its nbest attribute.
+
+    The oracles are the entries with the fewest errors (the first in the list on ties); see the module docstring
+    for how they are found. The anchored word alignment mode may not find the alignment with the fewest errors, so
+    in that mode the WER oracle is found like the POWER oracle, by aligning entries in order of their lower bound.
+    With candidates=N, at most N entries are aligned for each oracle found that way, which is faster but
+    approximate.
+    '''
+    def __init__(self, lexicon, candidates=0, **kwargs):
+        SegmentScorer.__init__(self, lexicon, **kwargs)
+        self.candidates = candidates
+
+    def align_words(self, refline, hypline):
+        '''A PowerAligner with the WER results of a segment only (the POWER alignment is left out).'''
+        return PowerAligner(refline, hypline, lowercase=self.lowercase, lexicon=self.lexicon,
+                            pronouncer=self.pronouncer(), **self.kwargs)
+
+    def score(self, refline, hyplines):
+        if not refline and not all(hyplines):
+            # A blank entry matches the blank reference
+            return None
+        ref = refline.split()
+        hyps = [hypline.split() for hypline in hyplines]
+        weights = self.kwargs.get('word_align_weights', Levenshtein.wordAlignWeights)
+        if self.lowercase:
+            tokens = ([x.lower() for x in ref], [[x.lower() for x in hyp] for hyp in hyps])
+        else:
+            tokens = (ref, hyps)
+
+        indels, rows = prefix_costs(tokens[0], tokens[1], indelWeights)
+        passes = 1
+        bounds = [max(len(ref), len(hyp)) - (len(ref) + len(hyp) - indel) // 2 for hyp, indel in zip(hyps, indels)]
+        order = sorted(range(len(hyps)), key=lambda k: (bounds[k], k))
+        if self.candidates:
+            order = order[:self.candidates]
+
+        results = {}
+        def scored(k):
+            if k not in results:
+                results[k] = SegmentScorer.score(self, refline, hyplines[k], ref)
+            return results[k]
+
+        word_results = {}
+        def words_only(k):
+            if k in results:
+                return results[k]
+            if k not in word_results:
+                word_results[k] = self.align_words(refline, hyplines[k])
+            return word_results[k]
+
+        if self.kwargs.get('word_align_mode', AlignMode.Full) == AlignMode.Anchored:
+            wer_rank = best_entry(order, bounds, lambda k: errors(words_only(k).wer_components))
+        else:
+            _, counts, count_rows = prefix_counts(tokens[0], tokens[1], weights)
+            rows += count_rows
+            passes += 1
+            wer_rank = min(range(len(hyps)), key=lambda k: (sum(counts[k][1:]), k))
+        power_rank = best_entry(order, bounds, lambda k: errors(scored(k).power_components))
+
+        wer_best = words_only(wer_rank)
+        power_best = results[power_rank]
+        result = ScoredSegment(wer=wer_best.wer, wer_components=wer_best.wer_components,
+                               wer_alignment=wer_best.wer_alignment, power=power_best.power,
+                               power_components=power_best.power_components,
+                               power_alignment=power_best.power_alignment, split_regions=power_best.split_regions,
+                               error_indexes=power_best.error_indexes,
+                               phonetic_alignments=power_best.phonetic_alignments)
+        result.nbest = NbestChoice(len(hyps), wer_rank, power_rank, hyplines[wer_rank], hyplines[power_rank],
+                                   rows, passes * sum(len(hyp) for hyp in hyps), len(results))
+        return result
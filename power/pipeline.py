@@ -0,0 +1,472 @@
+'''
+Corpus scoring for power.py as a chain of generator stages:
+
+    read_segments -> prefetch -> score_segments (SegmentScorer) -> System writers and ScoreTotals (power.py)
+
+With several hypothesis systems, read_systems and a SystemsScorer score all systems of a segment in one task, and
+each System of power.py adds its results to its own ScoreTotals. A PreviousRun passed to score_segments supplies
+earlier results for unchanged segments.
+
+Each stage holds a bounded number of segments (the prefetch queue, the window of segments in flight in the
+worker pool), so a corpus streams through in constant memory and a slow writer holds back reading and alignment.
+Results are always yielded in segment order, so writers and score totals are identical for any number of jobs.
+'''
+import hashlib
+import itertools
+import json
+import multiprocessing
+import threading
+from collections import Counter, defaultdict, deque
+from queue import Full, Queue
+from power.aligner import PowerAligner
+from power.cache import LRUCache, SqliteCache
+from power.levenshtein import AlignEngine, AlignMode, ExpandedAlignment, Levenshtein
+from power.lexicon import lexicon_fingerprint
+from power.pronounce import get_pronouncer
+from power.readers import AlignmentReaderJson
+
+
+def read_segments(f_ref, f_hyp):
+    '''Yields stripped (refline, hypline) pairs. Assumes that line counts match.'''
+    for refline in f_ref:
+        yield refline.strip(), f_hyp.readline().strip()
+
+
+_end = object()
+
+def prefetch(iterable, size=64):
+    '''
+    Iterates over iterable in a background thread, buffering at most size items ahead of the consumer.
+    Used to overlap reading the input files with alignment. Exceptions are re-raised in the consumer.
+    If the consumer stops early (it raises, or closes this generator), the thread stops reading and closes
+    iterable instead of waiting for buffer space forever.
+    '''
+    buffer = Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(entry):
+        # Returns False if the consumer stopped before there was room for entry.
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def fill():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    break
+            else:
+                put((_end, None))
+        except Exception as e:
+            put((_end, e))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    reader = threading.Thread(target=fill)
+    reader.daemon = True
+    reader.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _end:
+                break
+            yield item
+    finally:
+        stop.set()
+    if error is not None:
+        raise error
+
+
+class ScoredSegment(object):
+    '''
+    The WER and POWER results of a segment, with the same attributes as an aligned PowerAligner.
+    Can be serialized with to_dict(), e.g. to cache the results of a segment.
+    '''
+    fields = ['wer', 'wer_components', 'power', 'power_components', 'error_indexes']
+    alignment_fields = ['wer_alignment', 'power_alignment']
+
+    def __init__(self, **kwargs):
+        self.pronouncer = None
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    @staticmethod
+    def to_dict(aligner):
+        '''JSON-serializable results of an aligned PowerAligner (or ScoredSegment).'''
+        d = dict((field, getattr(aligner, field)) for field in ScoredSegment.fields)
+        for field in ScoredSegment.alignment_fields:
+            d[field] = getattr(aligner, field).to_dict()
+        d['split_regions'] = [x.to_dict() for x in aligner.split_regions]
+        d['phonetic_alignments'] = [x.to_dict() if x else None for x in aligner.phonetic_alignments]
+        return d
+
+    @staticmethod
+    def from_dict(d, ref=None, hyp=None):
+        '''
+        Inverse of to_dict. If ref and hyp tokens are given, they replace the words of the stored alignments
+        (e.g. results cached for a lowercased segment, restored with the casing of another segment).
+        '''
+        def count(words):
+            return sum(len(x.split()) for x in words)
+
+        def surface(words, tokens, start):
+            # Replaces the words of each alignment slot with the next tokens from tokens[start:].
+            if tokens is None:
+                return words
+            restored = []
+            for x in words:
+                n = len(x.split())
+                restored.append(' '.join(tokens[start:start+n]))
+                start += n
+            return restored
+
+        def restore(alignments):
+            # Region 0 of split_regions shares its lists with power_alignment, which extends them over the whole
+            # segment; so the other regions are positioned from the end of the segment.
+            ref_start = len(ref or []) - sum(count(a['s1']) for a in alignments[1:])
+            hyp_start = len(hyp or []) - sum(count(a['s2']) for a in alignments[1:])
+            restored = []
+            for k, a in enumerate(alignments):
+                a = dict(a)
+                if k == 0:
+                    a['s1'] = surface(a['s1'], ref, 0)
+                    a['s2'] = surface(a['s2'], hyp, 0)
+                else:
+                    a['s1'] = surface(a['s1'], ref, ref_start)
+                    a['s2'] = surface(a['s2'], hyp, hyp_start)
+                    ref_start += count(a['s1'])
+                    hyp_start += count(a['s2'])
+                restored.append(ExpandedAlignment.from_dict(a))
+            return restored
+
+        kwargs = dict((field, d[field]) for field in ScoredSegment.fields)
+        kwargs['wer_components'] = dict(kwargs['wer_components'])
+        kwargs['power_components'] = dict(kwargs['power_components'])
+        kwargs['error_indexes'] = list(kwargs['error_indexes'])
+        kwargs['wer_alignment'], = restore([d['wer_alignment']])
+        kwargs['power_alignment'], = restore([d['power_alignment']])
+        kwargs['split_regions'] = restore(d['split_regions'])
+        kwargs['phonetic_alignments'] = [ExpandedAlignment.from_dict(x) if x else None
+                                         for x in d['phonetic_alignments']]
+        return ScoredSegment(**kwargs)
+
+
+class SegmentScorer(object):
+    '''
+    Runs the WER and POWER alignments of one segment with a fixed set of PowerAligner options.
+    Holds only the options (not the pronouncer), so it is cheap to send to worker processes.
+
+    Phone realignments are shared by the segments of a process, in an LRUCache of phone_memo_size entries.
+    Results are cached by content: the (lowercased, unless case-sensitive) ref and hyp tokens, the word alignment
+    weights, mode and engine, and the lexicon fingerprint. Each process keeps the last cache_size results in memory; if
+    result_cache is a file path, results are also stored there (see SqliteCache) and shared across runs.
+    '''
+    # Bump when alignment results change, to invalidate stored results.
+    result_version = 1
+
+    def __init__(self, lexicon, lowercase=False, verbose=False, word_align_weights=None, oov_cache=None,
+                 result_cache=None, cache_size=4096, phone_memo_size=16384, **kwargs):
+        self.lexicon = lexicon
+        self.oov_cache = oov_cache
+        self.result_cache = result_cache
+        self.cache_size = cache_size
+        self.phone_memo_size = phone_memo_size
+        self.lowercase = lowercase
+        self.verbose = verbose
+        self.kwargs = dict(kwargs)
+        if word_align_weights:
+            self.kwargs['word_align_weights'] = word_align_weights
+        self._caches = None
+        self._phone_memo = None
+
+    def __getstate__(self):
+        # Each process keeps its own caches.
+        state = dict(self.__dict__)
+        state['_caches'] = None
+        state['_phone_memo'] = None
+        return state
+
+    def pronouncer(self):
+        '''The process-wide pronouncer for the lexicon (see get_pronouncer).'''
+        return get_pronouncer(self.lexicon, oov_cache=self.oov_cache)
+
+    def phone_memo(self):
+        '''The phone realignments of this process (see PowerAligner.alignPhones), or None if phone_memo_size is 0.'''
+        if self._phone_memo is None and self.phone_memo_size:
+            self._phone_memo = LRUCache(self.phone_memo_size)
+        return self._phone_memo
+
+    def caches(self):
+        '''The (memory, disk) result caches of this process; disk is None without a result_cache file.'''
+        if self._caches is None:
+            memory = LRUCache(self.cache_size) if self.cache_size else None
+            disk = None
+            if self.result_cache:
+                namespace = "segment:{0}:{1}".format(SegmentScorer.result_version, lexicon_fingerprint(self.lexicon))
+                disk = SqliteCache(self.result_cache, namespace)
+            self._caches = (memory, disk)
+        return self._caches
+
+    def options(self):
+        '''The options that results depend on, to check that earlier results can be reused (see PreviousRun).'''
+        weights = self.kwargs.get('word_align_weights', Levenshtein.wordAlignWeights)
+        return {'version': SegmentScorer.result_version, 'lowercase': self.lowercase,
+                'word_align_weights': dict(weights), 'lexicon': lexicon_fingerprint(self.lexicon),
+                'engine': self.kwargs.get('engine', AlignEngine.Python),
+                'word_align_mode': self.kwargs.get('word_align_mode', AlignMode.Full)}
+
+    def cache_key(self, ref, hyp):
+        if self.lowercase:
+            ref = [x.lower() for x in ref]
+            hyp = [x.lower() for x in hyp]
+        weights = self.kwargs.get('word_align_weights', Levenshtein.wordAlignWeights)
+        # Anchored alignments may differ from the others, so results of each mode (and engine) are kept apart.
+        return json.dumps([self.lowercase, sorted(weights.items()), self.kwargs.get('word_align_mode', AlignMode.Full),
+                           self.kwargs.get('engine', AlignEngine.Python), ref, hyp])
+
+    def score(self, refline, hypline, ref=None):
+        '''
+        Returns the aligned PowerAligner (or cached ScoredSegment) for a segment, or None if both lines are blank.
+        ref may give the tokens of refline, if they are already split.
+        '''
+        if not refline and not hypline:
+            # Nothing to compare
+            return None
+        memory, disk = self.caches()
+        if memory is None and disk is None:
+            return self.align(refline, hypline)
+
+        ref = ref if ref is not None else refline.split()
+        hyp = hypline.split()
+        key = self.cache_key(ref, hyp)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest() if disk is not None else None
+        d = memory.get(key) if memory is not None else None
+        if d is None and disk is not None:
+            value = disk.get(digest)
+            if value is not None:
+                d = json.loads(value)
+                if memory is not None:
+                    memory.put(key, d)
+        if d is not None:
+            return ScoredSegment.from_dict(d, ref, hyp)
+
+        aligner = self.align(refline, hypline)
+        d = ScoredSegment.to_dict(aligner)
+        if memory is not None:
+            memory.put(key, d)
+        if disk is not None:
+            disk.put(digest, json.dumps(d))
+        return aligner
+
+    def align(self, refline, hypline):
+        aligner = PowerAligner(refline, hypline, lowercase=self.lowercase, verbose=self.verbose,
+                               lexicon=self.lexicon, pronouncer=self.pronouncer(), phone_memo=self.phone_memo(),
+                               **self.kwargs)
+        aligner.align()
+        return aligner
+
+
+class SystemsScorer(SegmentScorer):
+    '''
+    Scores the hypotheses of several systems for the same reference segment, as one task.
+    The reference is split once per segment, and its word pronunciations are looked up once and then served from
+    the pronouncer's cache for the other systems.
+    '''
+    def score(self, refline, hyplines):
+        '''Returns a list with the result of each system (see SegmentScorer.score).'''
+        ref = refline.split()
+        return [SegmentScorer.score(self, refline, hypline, ref) for hypline in hyplines]
+
+
+def read_systems(f_ref, f_hyps):
+    '''Yields stripped (refline, hyplines) pairs, with a line from each of f_hyps. Assumes that line counts match.'''
+    for refline in f_ref:
+        yield refline.strip(), tuple(f_hyp.readline().strip() for f_hyp in f_hyps)
+
+
+# The scorer of a worker process, set by _init_worker.
+_worker_scorer = None
+
+def _init_worker(scorer):
+    global _worker_scorer
+    _worker_scorer = scorer
+    # Load the lexicon once per worker, before the first segment arrives.
+    scorer.pronouncer()
+
+def score_segment(segment):
+    '''Scores a (refline, hypline) pair in a worker process.'''
+    aligner = _worker_scorer.score(*segment)
+    # The parent has its own pronouncer and phone memo; don't send them back with every result.
+    for result in (aligner if isinstance(aligner, list) else [aligner]):
+        if result is not None:
+            result.pronouncer = None
+            result.phone_memo = None
+    return segment, aligner
+
+
+def score_batch(batch):
+    '''Scores a list of (refline, hypline) pairs in a worker process.'''
+    return [score_segment(segment) for segment in batch]
+
+def score_segments(segments, scorer, jobs=1, chunksize=8, window=None, reuse=None):
+    '''
+    Scores (refline, hypline) pairs and yields (segment, aligner) pairs in segment order; the aligner is None
+    for blank segments.
+    jobs > 1 spreads the segments over that many worker processes; jobs == 0 uses one per CPU. Segments are sent
+    in batches of chunksize, with at most window batches (default: two per process) in flight at a time.
+    reuse, if given, is called with every segment in order, and may return earlier results for it (e.g. a
+    PreviousRun); only the other segments are scored.
+    '''
+    if jobs == 1:
+        for segment in segments:
+            result = reuse(segment) if reuse is not None else None
+            yield segment, result if result is not None else scorer.score(*segment)
+        return
+
+    jobs = jobs or multiprocessing.cpu_count()
+    window = window or 2 * jobs
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(scorer,))
+    try:
+        pending = deque()
+        segments = iter(segments)
+        while True:
+            batch = list(itertools.islice(segments, chunksize))
+            if batch:
+                reused = [reuse(segment) if reuse is not None else None for segment in batch]
+                missing = [segment for segment, result in zip(batch, reused) if result is None]
+                scored = pool.apply_async(score_batch, (missing,)) if missing else None
+                pending.append((batch, reused, scored))
+            if pending and (len(pending) >= window or not batch):
+                batch, reused, scored = pending.popleft()
+                scored = iter(scored.get()) if scored is not None else None
+                for segment, result in zip(batch, reused):
+                    if result is None:
+                        segment, result = next(scored)
+                    yield segment, result
+            elif not batch:
+                break
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class PreviousRun(object):
+    '''
+    The results of an earlier run of power.py, read back from its PREFIX.power.json and PREFIX.wer.json output
+    (written with -f json --print-wer) and the ref and hyp files it scored.
+    Called with each segment of the new run in order, it returns the earlier results of the segment if its ref
+    and hyp lines are unchanged, and None otherwise. Phonetic alignments are not part of the json output, so
+    reused segments have none.
+    If options (see SegmentScorer.options) are given, nothing is reused unless the earlier run wrote the same
+    options to PREFIX.options.json (see write_options); reason then tells why.
+    '''
+    def __init__(self, prefix, reffile, hypfile, lowercase=False, options=None):
+        self.lowercase = lowercase
+        self.reason = self.check_options(prefix, options) if options is not None else None
+        self.ref = open(reffile, 'r')
+        self.hyp = open(hypfile, 'r')
+        self.results = {'power': self.read_results("{0}.power.json".format(prefix)),
+                        'wer': self.read_results("{0}.wer.json".format(prefix))}
+        self.heads = {}
+        self.segid = 0
+        self.reused = 0
+
+    @staticmethod
+    def write_options(prefix, options):
+        '''Writes the options of a run next to its output, so a later run can check them.'''
+        with open("{0}.options.json".format(prefix), 'w') as f:
+            json.dump(options, f, sort_keys=True)
+            f.write('\n')
+
+    @staticmethod
+    def check_options(prefix, options):
+        '''None if the run with output prefix was scored with options, otherwise the reason why not.'''
+        filepath = "{0}.options.json".format(prefix)
+        try:
+            with open(filepath, 'r') as f:
+                previous = json.load(f)
+        except IOError:
+            return "{0} is missing".format(filepath)
+        # Compare after a json round trip, as stored
+        options = json.loads(json.dumps(options))
+        changed = sorted(key for key in set(options) | set(previous) if options.get(key) != previous.get(key))
+        if changed:
+            return "options differ: {0}".format(', '.join(changed))
+        return None
+
+    def read_results(self, filepath):
+        '''Yields (segment id, alignment) for the non-blank segments of a json output file.'''
+        with open(filepath, 'r') as f:
+            for line in f:
+                in_dict = json.loads(line)
+                if in_dict:
+                    yield in_dict['id'], AlignmentReaderJson.read_dict(in_dict)
+
+    def result(self, name):
+        '''The 'power' or 'wer' alignment of the current segment, or None.'''
+        head = self.heads.get(name)
+        while head is None or head[0] < self.segid:
+            head = next(self.results[name], None)
+            if head is None:
+                break
+            self.heads[name] = head
+        if head is not None and head[0] == self.segid:
+            return head[1]
+        return None
+
+    def __call__(self, segment):
+        if self.reason is not None:
+            return None
+        self.segid += 1
+        previous = (self.ref.readline().strip(), self.hyp.readline().strip())
+        power_alignment = self.result('power')
+        wer_alignment = self.result('wer')
+        if previous != segment or power_alignment is None or wer_alignment is None:
+            return None
+
+        self.reused += 1
+        wer_alignment.lowercase = self.lowercase
+        power_alignment.lowercase = self.lowercase
+        wer, wer_components = wer_alignment.error_rate()
+        power, power_components = power_alignment.error_rate()
+        return ScoredSegment(wer=wer, wer_components=wer_components, wer_alignment=wer_alignment,
+                             power=power, power_components=power_components, power_alignment=power_alignment,
+                             split_regions=[], error_indexes=[], phonetic_alignments=None)
+
+    def close(self):
+        for results in self.results.values():
+            results.close()
+        self.ref.close()
+        self.hyp.close()
+
+
+class ScoreTotals(object):
+    '''Corpus-level WER and POWER score components and confusion pairs.'''
+    def __init__(self, confusions=False, wer_confusions=False):
+        self.confusions = confusions
+        self.wer_confusions_enabled = wer_confusions
+        self.wer_components = Counter()
+        self.power_components = Counter()
+        self.wer_confusions = defaultdict(Counter)
+        self.power_confusions = defaultdict(Counter)
+
+    def add(self, aligner):
+        self.wer_components += Counter(aligner.wer_components)
+        self.power_components += Counter(aligner.power_components)
+
+        if self.confusions:
+            if self.wer_confusions_enabled:
+                cp = aligner.wer_alignment.confusion_pairs()
+                for key in cp.keys():
+                    self.wer_confusions[key] += cp[key]
+
+            cp = aligner.power_alignment.confusion_pairs()
+            for key in cp.keys():
+                self.power_confusions[key] += cp[key]
@@ -5,11 +5,12 @@ Created on Mar 30, 2015
 Assuming you have a file of word sequences, this processes them through Festival to generate pronunciations.
 
 '''
+import os
 import sys
-import json
+import threading
 from itertools import groupby
-from normalize import NumToTextEng, splitHyphens
-import pyphen
+from power.cache import LRUCache, SqliteCache
+from power.lexicon import SortedKeyIndex, load_lexicon, lexicon_fingerprint
 
 class PronouncerType:
     Base = "base"
@@ -22,24 +23,96 @@ class PronouncerBase(object):
         '''G2P conversion'''
         raise NotImplementedError
 
+_pronouncers = {}
+_pronouncers_lock = threading.Lock()
+
+def get_pronouncer(lexicon=None, pronounce_type=PronouncerType.Lexicon, oov_cache=None):
+    '''
+    Returns the process-wide pronouncer for a lexicon, loading it on first use.
+    Pronouncers are keyed by the absolute lexicon path (and OOV cache path), so a corpus run only pays the
+    lexicon load cost once.
+    '''
+    if pronounce_type != PronouncerType.Lexicon:
+        return PronouncerBase()
+    key = (os.path.abspath(lexicon), os.path.abspath(oov_cache) if oov_cache else None)
+    with _pronouncers_lock:
+        pronouncer = _pronouncers.get(key)
+        if pronouncer is None:
+            pronouncer = PronouncerLex(lexicon, oov_cache=oov_cache)
+            _pronouncers[key] = pronouncer
+    return pronouncer
+
+def clear_pronouncers():
+    '''Drops all shared pronouncers (e.g. after a lexicon file was rebuilt).'''
+    with _pronouncers_lock:
+        _pronouncers.clear()
+
 class PronouncerLex(PronouncerBase):
     '''Lexicon-based pronunciation generator. Looks up words in the lexicon and if they aren't found, uses a hacky alternative.
+    The lexicon is either a JSON key/value dict or a compiled lexicon (see power.lexicon), which is memory-mapped.
+    Pronunciations of lowercased words (lexicon entries and fallbacks alike) are memoized in an LRU cache of
+    cache_size words; its hit/miss/eviction counters are in self.cache.
+    If oov_cache is a file path, fallback pronunciations of out-of-lexicon words are also stored there (see
+    SqliteCache), keyed by the lexicon fingerprint, so later runs with the same lexicon skip the fallback G2P.
     NOTE: English-only
     '''
-    def __init__(self, lexicon):
-        with open(lexicon, 'r') as f:
-            self.lexicon = json.load(f)
-        self.fallbackDict = pyphen.Pyphen(lang='en_US')
+    # Bump when alt_pronounce changes, to invalidate stored fallback pronunciations.
+    fallback_version = 1
+
+    def __init__(self, lexicon, cache_size=65536, oov_cache=None):
+        self.lexicon = load_lexicon(lexicon)
+        self.cache = LRUCache(cache_size)
+        self.oov_cache = None
+        if oov_cache:
+            namespace = "oov:{0}:{1}".format(PronouncerLex.fallback_version, lexicon_fingerprint(lexicon))
+            self.oov_cache = SqliteCache(oov_cache, namespace)
+        self._fallbackDict = None
+        self._prefixIndex = None
+
+    @property
+    def fallbackDict(self):
+        '''Pyphen hyphenator for out-of-lexicon words, loaded the first time one is seen.'''
+        if self._fallbackDict is None:
+            import pyphen
+            self._fallbackDict = pyphen.Pyphen(lang='en_US')
+        return self._fallbackDict
+
+    @property
+    def prefixIndex(self):
+        '''Longest-prefix search over the lexicon keys, built the first time a fallback pronunciation is needed.'''
+        if self._prefixIndex is None:
+            if hasattr(self.lexicon, 'longest_prefix'):
+                self._prefixIndex = self.lexicon
+            else:
+                self._prefixIndex = SortedKeyIndex(self.lexicon)
+        return self._prefixIndex
 
     def pronounce(self, words):
         '''G2P using Pyphen + heuristics'''
-        wordsLower = (w.lower() for w in words)
-        prons = [self.lexicon[w] if w in self.lexicon else self.alt_pronounce(
-            w) for w in wordsLower]
+        prons = [self.pronounce_word(w.lower()) for w in words]
         return "| {0} |".format(' | '.join(prons)).split()
 
+    def pronounce_word(self, word):
+        '''Pronunciation of a single lowercased word, from the cache, the lexicon, or alt_pronounce.'''
+        pron = self.cache.get(word)
+        if pron is None:
+            pron = self.lexicon[word] if word in self.lexicon else self.stored_alt_pronounce(word)
+            self.cache.put(word, pron)
+        return pron
+
+    def stored_alt_pronounce(self, word):
+        '''alt_pronounce, through the persistent OOV cache if there is one.'''
+        if self.oov_cache is None:
+            return self.alt_pronounce(word)
+        pron = self.oov_cache.get(word)
+        if pron is None:
+            pron = self.alt_pronounce(word)
+            self.oov_cache.put(word, pron)
+        return pron
+
     def alt_pronounce(self, word):
         '''Alternative ways to pronounce the word. Adds simple digit to word conversion'''
+        from normalize import NumToTextEng, splitHyphens
         prons = []
         # Split words along hyphens
         wordsSplit = splitHyphens(' '.join(word))
@@ -65,11 +138,11 @@ class PronouncerLex(PronouncerBase):
             n = len(syl)
             sylpron = []
             while m < n:
-                pronidx = [(n-i, self.lexicon[syl[m:n-i]])
-                        for i in range(n) if syl[m:n-i] in self.lexicon]
-                if not pronidx:
+                # Longest lexicon entry starting at m
+                match = self.prefixIndex.longest_prefix(syl, m)
+                if not match:
                     break
-                j, p = pronidx[0]
+                j, p = match
                 sylpron.append(p)
                 m = j
             if not sylpron:
@@ -13,7 +13,10 @@ class AlignmentReaderJson(object):
 				
 	@staticmethod
 	def read_json(jstr):
-		in_dict = json.loads(jstr)
+		return AlignmentReaderJson.read_dict(json.loads(jstr))
+
+	@staticmethod
+	def read_dict(in_dict):
 		if not in_dict:
 			return None
 		
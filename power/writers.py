@@ -189,3 +189,28 @@ class CompareWriter:
 | Diff   | {1:5d} {2:5d} | {14:-5d} {15:-5d}  {16:-5d}  {17:-5d}  {18:-3.1%} |
 `---------------------------------------------------------'
 """.format(hypfile, linecount, wer_score_components['L'], wer_score_components['C'], wer_score_components['S'], wer_score_components['D'], wer_score_components['I'], final_wer, power_score_components['L'], power_score_components['C'], power_score_components['S'], power_score_components['D'], power_score_components['I'], final_power, diff_components['C'], diff_components['S'], diff_components['D'], diff_components['I'], diff_score))
+
+
+class SystemsWriter:
+	'''Comparison table of the corpus WER and POWER of several hypothesis systems scored against one reference.'''
+	@staticmethod
+	def format_table(reffile, systems):
+		'''
+		systems is a list of (name, hypfile, linecount, final_wer, final_power, wer_score_components,
+		power_score_components) tuples, listed in the given order.
+		'''
+		width = max([len('System')] + [len(system[0]) for system in systems])
+		lines = ["Ref file   : %s" % reffile, ""]
+		lines.append("{0:<{1}} | # Snt # Wrd |  WER    Sub    Del    Ins  | POWER   Sub    Del    Ins  |  Diff".format('System', width))
+		lines.append('-' * len(lines[-1]))
+		for name, hypfile, linecount, final_wer, final_power, wer_score_components, power_score_components in systems:
+			lines.append("{0:<{1}} | {2:5d} {3:5d} | {4:5.1%} {5:5d}  {6:5d}  {7:5d} | {8:5.1%} {9:5d}  {10:5d}  {11:5d} | {12:+5.1%}".format(
+				name, width, linecount, wer_score_components['L'], final_wer, wer_score_components['S'], wer_score_components['D'],
+				wer_score_components['I'], final_power, power_score_components['S'], power_score_components['D'],
+				power_score_components['I'], final_power - final_wer))
+		return '\n'.join(lines) + '\n'
+
+	@staticmethod
+	def write(filepath, reffile, systems):
+		with open(filepath, 'w') as out_file:
+			out_file.write(SystemsWriter.format_table(reffile, systems))
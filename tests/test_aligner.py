@@ -1,7 +1,8 @@
 import unittest
-from power.aligner import PowerAligner, CharToWordAligner
+from power.aligner import PowerAligner, CharToWordAligner, AlignResult
 from power.pronounce import PronouncerType
-from power.levenshtein import Levenshtein, ExpandedAlignment
+from power.levenshtein import Levenshtein, CompactAlignment, ExpandedAlignment, Vocabulary
+from power.cache import LRUCache
 
 def preproc(aligned_string):
     aligned = [x if x != '_' else "" for x in aligned_string.split()]
@@ -176,6 +177,85 @@ class test_aligner(unittest.TestCase):
         self.assertEqual(word_align.s1, [x if x != "_" else "" for x in ref])
         self.assertEqual(word_align.s2, [x if x != "_" else "" for x in hyp])
 
+    def test_align_batch(self):
+        pairs = [("So to address this we developed", "so to address this we developed"),
+                 ("with a Dr. Brown in Stanford", "with the doctor brahmin stanford"),
+                 ("", ""),
+                 ("with a Dr. Brown in Stanford", "with the doctor brahmin stanford")]
+        results = PowerAligner.align_batch(pairs, lowercase=True, lexicon=self.lex)
+        self.assertEqual(len(results), 4)
+        self.assertIsNone(results[2])
+        self.assertIs(results[1], results[3])
+        self.assertIsNone(results[0].power_alignment)
+
+        for (ref, hyp), result in zip(pairs[:2], results):
+            aligner = PowerAligner(ref, hyp, lowercase=True, lexicon=self.lex)
+            aligner.align()
+            self.assertEqual(result.wer_components, aligner.wer_components)
+            self.assertEqual(result.power_components, aligner.power_components)
+            self.assertEqual(result.wer_labels, ''.join(aligner.wer_alignment.align))
+            self.assertEqual(result.power_labels, ''.join(aligner.power_alignment.align))
+
+        wer_components, power_components = AlignResult.totals(results)
+        self.assertEqual(power_components['L'], 6 + 6 + 6)
+        self.assertEqual(wer_components['C'], 6 + 2 * results[1].wer_components['C'])
+
+        # Pairs with the same tokens share their results, and so do their phone realignments
+        memo = LRUCache()
+        variants = [pairs[1], ("with  A dr. brown in Stanford ", pairs[1][1].upper()),
+                    (pairs[1][0], pairs[1][1] + " table")]
+        batch = PowerAligner.align_batch(variants, lowercase=True, lexicon=self.lex, phone_memo=memo)
+        self.assertIs(batch[0], batch[1])
+        self.assertIsNot(batch[0], batch[2])
+        self.assertEqual(batch[0].power_components, results[1].power_components)
+        self.assertGreater(memo.hits, 0)
+        kept = PowerAligner.align_batch(variants[:2], lowercase=True, lexicon=self.lex, alignments=True)
+        self.assertIsNot(kept[0], kept[1])
+        self.assertEqual(kept[1].power_alignment.s1_string(), "with A dr. brown in Stanford")
+
+        results = PowerAligner.align_batch(pairs[1:2], lowercase=True, lexicon=self.lex, alignments=True)
+        self.assertEqual(results[0].power_alignment.s1_string(), pairs[1][0])
+
+        vocabulary = Vocabulary()
+        compact = PowerAligner.align_batch(pairs[1:2], lowercase=True, lexicon=self.lex, alignments=True,
+                                           vocabulary=vocabulary)
+        self.assertIsInstance(compact[0].power_alignment, CompactAlignment)
+        self.assertIs(compact[0].wer_alignment.vocabulary, vocabulary)
+        self.assertEqual(compact[0].power_alignment.to_dict(), results[0].power_alignment.to_dict())
+
+    def test_phone_memo(self):
+        pairs = [("So to address this we developed with a Dr. Brown in Stanford virtual dissection table",
+                  "so to address this we developed with the doctor brahmin stanford virtual dissection table"),
+                 ("you know cadaver dissection is the traditional way of learning human anatomy",
+                  "seeing a cadaver dissection and ease the traditional way of loaning human and that to me")]
+        memo = LRUCache(None)
+        misses = []
+        avoided = []
+        for _ in range(2):
+            hits = memo.hits
+            avoided.append(0)
+            for ref, hyp in pairs:
+                shared = PowerAligner(ref, hyp, lowercase=True, lexicon=self.lex, phone_memo=memo)
+                shared.align()
+                alone = PowerAligner(ref, hyp, lowercase=True, lexicon=self.lex)
+                alone.align()
+                self.assertEqual(shared.power_alignment.align, alone.power_alignment.align)
+                self.assertEqual(shared.power_alignment.s1, alone.power_alignment.s1)
+                self.assertEqual(shared.power_alignment.s2, alone.power_alignment.s2)
+                avoided[-1] += shared.realignments_avoided
+            misses.append(memo.misses)
+            self.assertEqual(avoided[-1], memo.hits - hits)
+        # The second pass aligns no phones
+        self.assertEqual(misses[1], misses[0])
+        self.assertEqual(avoided[1] - avoided[0], misses[0])
+
+        # Alignments handed out are copies of the memo's
+        ref_phones = "| # k ae t |".split()
+        hyp_phones = "| # k ae p |".split()
+        first = PowerAligner.alignPhones(ref_phones, hyp_phones, memo=memo)
+        first.align[0] = 'X'
+        self.assertEqual(PowerAligner.alignPhones(ref_phones, hyp_phones, memo=memo).align[0], 'C')
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from power.cache import LRUCache, SqliteCache
+
+class LRUCache_Test(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 0), 0)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats(), {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 2, 'evictions': 1})
+        self.assertAlmostEqual(cache.hit_rate(), 1 / 3)
+
+    def test_update_refreshes(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('a', 10)
+        cache.put('c', 3)
+        self.assertEqual(cache.get('a'), 10)
+        self.assertNotIn('b', cache)
+
+    def test_unbounded_and_clear(self):
+        cache = LRUCache(None)
+        for i in range(1000):
+            cache.put(i, i)
+        self.assertEqual(len(cache), 1000)
+        self.assertEqual(cache.evictions, 0)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hit_rate(), 0.0)
+
+class SqliteCache_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, "cache.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_persistent(self):
+        cache = SqliteCache(self.filepath, "ns1")
+        self.assertIsNone(cache.get("word"))
+        cache.put("word", "w er d")
+        cache.put("empty", "")
+        self.assertEqual(cache.get("word"), "w er d")
+        self.assertEqual(cache.get("empty"), "")
+        cache.close()
+
+        cache = SqliteCache(self.filepath, "ns1")
+        self.assertEqual(cache.get("word"), "w er d")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+        other = SqliteCache(self.filepath, "ns2")
+        self.assertIsNone(other.get("word"))
+        self.assertEqual(len(other), 0)
+
+    def test_pickle(self):
+        cache = SqliteCache(self.filepath, "ns")
+        cache.put("a", "1")
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(copy.get("a"), "1")
+
+if __name__ == "__main__":
+    unittest.main()
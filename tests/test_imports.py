@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies that must only load on first use.
+HEAVY_MODULES = ['pyphen', 'normalize', 'networkx', 'numpy']
+
+def run_python(*args):
+    return subprocess.run([sys.executable] + list(args), cwd=ROOT, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+def import_times(*args):
+    '''Parses `python -X importtime` output into (module, self_us) pairs.'''
+    times = []
+    for line in run_python('-X', 'importtime', *args).stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(self_us)))
+    return times
+
+class Imports_Test(unittest.TestCase):
+
+    def test_power_help_is_light(self):
+        times = import_times('power.py', '--help')
+        names = [name for name, _ in times]
+        for module in HEAVY_MODULES + ['power.aligner', 'power.pronounce']:
+            self.assertFalse([name for name in names if name == module or name.startswith(module + '.')], module)
+
+    def test_lev_help_is_light(self):
+        times = import_times('lev.py', '--help')
+        modules = set(name.split('.')[0] for name, _ in times)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_aligner_import_is_light(self):
+        out = run_python('-c', 'import sys, power.aligner, power.pronounce; '
+                               'print(" ".join(m for m in {0!r} if m in sys.modules))'.format(HEAVY_MODULES)).stdout
+        self.assertEqual(out.split(), [])
+
+if __name__ == "__main__":
+    unittest.main()
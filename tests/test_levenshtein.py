@@ -0,0 +1,504 @@
+import random
+import unittest
+import copy
+import pickle
+from power.levenshtein import (Levenshtein, AlignEngine, AlignMode, AlignmentView, CompactAlignment, ExpandedAlignment,
+                               SubstitutionTable, Vocabulary)
+from power.aligner import PowerAligner
+
+def random_pairs(count, vocab, max_len=15, seed=1):
+    rng = random.Random(seed)
+    for _ in range(count):
+        ref = [rng.choice(vocab) for _ in range(rng.randint(0, max_len))]
+        hyp = [rng.choice(vocab) for _ in range(rng.randint(0, max_len))]
+        yield ref, hyp
+
+phone_vocab = ['|', '#', 'ae', 'ao', 'iy', 'er', 'r', 'k', 't', 'n', 's', 'xx']
+word_vocab = ['a', 'b', 'c', 'd', 'e', 'A', 'B']
+
+class LevenshteinEngines_Test(unittest.TestCase):
+
+    def assertSameMatrix(self, ref, hyp, **kwargs):
+        expected = Levenshtein.align(ref, hyp, **kwargs)
+        actual = Levenshtein.align(ref, hyp, engine=AlignEngine.NumPy, **kwargs)
+        self.assertEqual(actual.dist, expected.dist)
+        for i in range(len(hyp) + 1):
+            for j in range(len(ref) + 1):
+                self.assertEqual(actual.backMatrix.getWeight(i, j), expected.backMatrix.getWeight(i, j))
+                self.assertEqual(actual.backMatrix.getBackTrackOptions(i, j),
+                                 expected.backMatrix.getBackTrackOptions(i, j))
+        self.assertEqual(actual.editops(), expected.editops())
+        if ref and hyp:
+            self.assertEqual(actual.expandAlign().align, expected.expandAlign().align)
+            self.assertEqual(actual.expandAlignCompact().align, expected.expandAlignCompact().align)
+
+    def test_numpy_words(self):
+        for ref, hyp in random_pairs(150, word_vocab):
+            self.assertSameMatrix(ref, hyp)
+            self.assertSameMatrix(ref, hyp, lowercase=True, weights=Levenshtein.wordAlignWeights)
+
+    def test_numpy_fractional_weights(self):
+        weights = {'C': 0, 'S': 1.5, 'D': 0.75, 'I': 1.0}
+        for ref, hyp in random_pairs(100, word_vocab, seed=2):
+            self.assertSameMatrix(ref, hyp, weights=weights)
+
+    def test_numpy_phones(self):
+        for ref, hyp in random_pairs(150, phone_vocab, seed=3):
+            self.assertSameMatrix(ref, hyp, weights=Levenshtein.wordAlignWeights,
+                                  reserve_list=PowerAligner.reserve_list, exclusive_sets=PowerAligner.exclusive_sets)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            Levenshtein.align(['a'], ['b'], engine='fortran')
+
+    def test_numpy_power_aligner(self):
+        ref = "They said Yes We asked them how happy they were and then we gave them an envelope"
+        hyp = "they said yes we gave we ask them how happy they were and then we gave them on low"
+        expected = PowerAligner(ref, hyp, lowercase=True, lexicon="lex/cmudict.rep.json")
+        expected.align()
+        actual = PowerAligner(ref, hyp, lowercase=True, lexicon="lex/cmudict.rep.json", engine=AlignEngine.NumPy)
+        actual.align()
+        self.assertEqual(actual.wer_alignment.align, expected.wer_alignment.align)
+        self.assertEqual(actual.power_alignment.align, expected.power_alignment.align)
+        self.assertEqual(actual.power_alignment.s1, expected.power_alignment.s1)
+        self.assertEqual(actual.power_alignment.s2, expected.power_alignment.s2)
+
+def edited_pairs(count, vocab, max_len=30, max_edits=8, seed=1):
+    '''Pairs of near-diagonal sequences: a random reference and a lightly edited copy of it.'''
+    rng = random.Random(seed)
+    for _ in range(count):
+        ref = [rng.choice(vocab) for _ in range(rng.randint(0, max_len))]
+        hyp = list(ref)
+        for _ in range(rng.randint(0, max_edits)):
+            pos = rng.randint(0, len(hyp))
+            op = rng.random()
+            if op < 0.3 and pos < len(hyp):
+                del hyp[pos]
+            elif op < 0.6:
+                hyp.insert(pos, rng.choice(vocab))
+            elif pos < len(hyp):
+                hyp[pos] = rng.choice(vocab)
+        yield ref, hyp
+
+class LevenshteinBanded_Test(unittest.TestCase):
+
+    def assertSameAlignment(self, ref, hyp, **kwargs):
+        expected = Levenshtein.align(ref, hyp, **kwargs)
+        actual = Levenshtein.alignBanded(ref, hyp, band=1, **kwargs)
+        self.assertEqual(actual.dist, expected.dist)
+        self.assertEqual(actual.editops(), expected.editops())
+        if ref and hyp:
+            self.assertEqual(actual.expandAlign().align, expected.expandAlign().align)
+            self.assertEqual(actual.expandAlignCompact().align, expected.expandAlignCompact().align)
+
+    def test_banded_words(self):
+        for ref, hyp in edited_pairs(150, word_vocab):
+            self.assertSameAlignment(ref, hyp)
+            self.assertSameAlignment(ref, hyp, lowercase=True, weights=Levenshtein.wordAlignWeights)
+
+    def test_banded_dissimilar(self):
+        for ref, hyp in random_pairs(100, word_vocab, seed=4):
+            self.assertSameAlignment(ref, hyp, weights=Levenshtein.wordAlignWeights)
+
+    def test_banded_phones(self):
+        for ref, hyp in edited_pairs(150, phone_vocab, seed=5):
+            self.assertSameAlignment(ref, hyp, weights=Levenshtein.wordAlignWeights,
+                                     reserve_list=PowerAligner.reserve_list, exclusive_sets=PowerAligner.exclusive_sets)
+
+    def test_banded_stays_narrow(self):
+        ref = ['w%d' % (i % 97) for i in range(600)]
+        hyp = ref[:100] + ref[101:300] + ['x'] + ref[300:]
+        lev = Levenshtein.alignBanded(ref, hyp)
+        self.assertEqual(lev.dist, 2)
+        self.assertEqual(lev.band, 8)
+        self.assertEqual(lev.editops(), Levenshtein.align(ref, hyp, engine=AlignEngine.NumPy).editops())
+
+class LevenshteinLinear_Test(unittest.TestCase):
+
+    def assertSameAlignment(self, ref, hyp, **kwargs):
+        lev = Levenshtein.align(ref, hyp, **kwargs)
+        lev.editops()
+        expected = lev.expandAlign()
+        actual = Levenshtein.alignLinear(ref, hyp, base_cells=0, **kwargs)
+        if expected is None:
+            self.assertIsNone(actual)
+            return
+        self.assertEqual(actual.s1, expected.s1)
+        self.assertEqual(actual.s2, expected.s2)
+        self.assertEqual(actual.align, expected.align)
+        self.assertEqual(actual.s1_map, expected.s1_map)
+        self.assertEqual(actual.s2_map, expected.s2_map)
+
+    def test_linear_words(self):
+        for ref, hyp in random_pairs(200, word_vocab, max_len=20, seed=6):
+            self.assertSameAlignment(ref, hyp)
+            self.assertSameAlignment(ref, hyp, lowercase=True, weights=Levenshtein.wordAlignWeights)
+            self.assertSameAlignment(ref, hyp, weights={'C': 1, 'S': 2, 'D': 1, 'I': 3})
+
+    def test_linear_phones(self):
+        for ref, hyp in random_pairs(200, phone_vocab, max_len=20, seed=7):
+            self.assertSameAlignment(ref, hyp, weights=Levenshtein.wordAlignWeights,
+                                     reserve_list=PowerAligner.reserve_list, exclusive_sets=PowerAligner.exclusive_sets)
+
+    def test_expanded_align_modes(self):
+        for ref, hyp in edited_pairs(50, word_vocab, seed=8):
+            if not ref or not hyp:
+                continue
+            expected = Levenshtein.expandedAlign(ref, hyp, weights=Levenshtein.wordAlignWeights)
+            for mode in (AlignMode.Banded, AlignMode.Linear):
+                actual = Levenshtein.expandedAlign(ref, hyp, mode=mode, weights=Levenshtein.wordAlignWeights)
+                self.assertEqual(actual.align, expected.align)
+                self.assertEqual(actual.s1, expected.s1)
+                self.assertEqual(actual.s2, expected.s2)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            Levenshtein.expandedAlign(['a'], ['b'], mode='diagonal')
+
+def hull_weight(align, hyplen, reflen):
+    '''Number of edges of an alignment path that are off the hull, as weighted in Levenshtein.bestPathsGraph.'''
+    i = j = 0
+    weight = 0
+    for label in align:
+        di = 0 if label == 'D' else 1
+        dj = 0 if label == 'I' else 1
+        if not ((di == 0 and i in (0, hyplen)) or (dj == 0 and j in (0, reflen))):
+            weight += 1
+        i += di
+        j += dj
+    return weight
+
+class LevenshteinCompact_Test(unittest.TestCase):
+
+    def test_compact_is_best_path(self):
+        weights = Levenshtein.wordAlignWeights
+        for ref, hyp in random_pairs(300, phone_vocab, max_len=12, seed=10):
+            if not ref or not hyp:
+                continue
+            lev = Levenshtein.align(ref, hyp, weights=weights, substitution_table=PowerAligner.phone_table)
+            compact = lev.expandAlignCompact()
+            self.assertEqual(compact.s1_tokens(), ref)
+            self.assertEqual(compact.s2_tokens(), hyp)
+            self.assertEqual(sum(weights[x] for x in compact.align), lev.dist)
+
+            # No best path of the lattice has a lower hull weight.
+            G = lev.bestPathsGraph()
+            best = {(0, 0): 0}
+            for cell in sorted(G.nodes()):
+                for prev in G[cell]:
+                    if prev < cell and prev in best:
+                        edge = 0 if G[cell][prev]['weight'] == 0 else 1
+                        if cell not in best or best[prev] + edge < best[cell]:
+                            best[cell] = best[prev] + edge
+            self.assertEqual(hull_weight(compact.align, len(hyp), len(ref)), best[(len(hyp), len(ref))])
+
+    def test_compact_path_is_valid(self):
+        # An undirected shortest path through the best-paths graph can step backwards and repeat tokens here.
+        ref = ['er', 'r', 'ao', 'ao', 'er', 'r', '|', 'n', 'r', '|', 'n', '#', 'n']
+        hyp = ['r', 'r', 'ae']
+        lev = Levenshtein.align(ref, hyp, weights=Levenshtein.wordAlignWeights, substitution_table=PowerAligner.phone_table)
+        compact = lev.expandAlignCompact()
+        self.assertEqual(compact.s1_tokens(), ref)
+        self.assertEqual(compact.s2_tokens(), hyp)
+        self.assertEqual(compact.align, ['D', 'D', 'D', 'D', 'D', 'C', 'D', 'D', 'C', 'I', 'D', 'D', 'D', 'D'])
+
+class LevenshteinTrim_Test(unittest.TestCase):
+
+    def assertSameAlignment(self, ref, hyp, mode=AlignMode.Full, **kwargs):
+        lev = Levenshtein.align(ref, hyp, **kwargs)
+        lev.editops()
+        expected = lev.expandAlign()
+        actual = Levenshtein.expandedAlign(ref, hyp, mode=mode, **kwargs)
+        self.assertEqual(actual.s1, expected.s1)
+        self.assertEqual(actual.s2, expected.s2)
+        self.assertEqual(actual.align, expected.align)
+        self.assertEqual(actual.s1_map, expected.s1_map)
+        self.assertEqual(actual.s2_map, expected.s2_map)
+
+    def shared_pairs(self, count, vocab, seed):
+        rng = random.Random(seed)
+        for ref, hyp in random_pairs(count, vocab, max_len=4, seed=seed):
+            stem = [rng.choice(vocab) for _ in range(rng.randint(0, 8))]
+            end = [rng.choice(vocab) for _ in range(rng.randint(0, 3))]
+            yield ref + stem + end, hyp + stem + end
+
+    def test_trimmed_words(self):
+        for ref, hyp in self.shared_pairs(300, word_vocab[:3], seed=12):
+            for mode in (AlignMode.Full, AlignMode.Banded):
+                self.assertSameAlignment(ref, hyp, mode=mode)
+                self.assertSameAlignment(ref, hyp, mode=mode, lowercase=True, weights=Levenshtein.wordAlignWeights)
+                self.assertSameAlignment(ref, hyp, mode=mode, weights={'C': 0, 'S': 1, 'D': 0, 'I': 2})
+
+    def test_trimmed_phones(self):
+        for ref, hyp in self.shared_pairs(300, phone_vocab, seed=13):
+            self.assertSameAlignment(ref, hyp, weights=Levenshtein.wordAlignWeights,
+                                     reserve_list=PowerAligner.reserve_list, exclusive_sets=PowerAligner.exclusive_sets)
+
+    def test_path_crosses_prefix(self):
+        # The first hyp "a" is inserted: the editops() path leaves the middle part on its first column
+        self.assertEqual(Levenshtein.expandedAlign(['a', 'b'], ['a', 'a', 'b']).align, ['I', 'C', 'C'])
+        self.assertSameAlignment(['x', 'a', 'b'], ['x', 'a', 'a', 'b'])
+
+    def test_identical(self):
+        ref = ['The', 'cat', 'sat']
+        for mode in (AlignMode.Full, AlignMode.Banded, AlignMode.Linear):
+            alignment = Levenshtein.expandedAlign(ref, ['the', 'cat', 'sat'], mode=mode, lowercase=True)
+            self.assertEqual(alignment.align, ['C', 'C', 'C'])
+            self.assertEqual(alignment.s1, ref)
+            self.assertEqual(alignment.s2, ['the', 'cat', 'sat'])
+        self.assertSameAlignment(ref, ref, weights={'C': 1, 'S': 1, 'D': 1, 'I': 1})
+
+    def test_trimmable(self):
+        self.assertTrue(Levenshtein.trimmable(None))
+        self.assertTrue(Levenshtein.trimmable(Levenshtein.wordAlignWeights))
+        self.assertFalse(Levenshtein.trimmable({'C': 1, 'S': 2, 'D': 1, 'I': 3}))
+
+class LevenshteinAnchored_Test(unittest.TestCase):
+
+    def test_anchors(self):
+        ref = "the cat sat on the mat today".split()
+        hyp = "a cat sat on a mat the today".split()
+        # "the" repeats in ref; "today" follows "mat" in both
+        self.assertEqual(Levenshtein.anchors(ref, hyp), [(1, 1), (2, 2), (3, 3), (5, 5), (6, 7)])
+        # Crossing unique tokens: only the longest chain in order is kept
+        self.assertEqual(Levenshtein.anchors(['a', 'b', 'c'], ['c', 'a', 'b']), [(0, 1), (1, 2)])
+
+    def test_anchored_document(self):
+        rng = random.Random(14)
+        vocab = ['w{0}'.format(k) for k in range(500)] + word_vocab
+        ref = [rng.choice(vocab) for _ in range(400)]
+        hyp = []
+        for token in ref:
+            x = rng.random()
+            if x < 0.1:
+                hyp.append(rng.choice(word_vocab))
+            elif x > 0.95:
+                hyp.extend([token, rng.choice(word_vocab)])
+            elif x > 0.05:
+                hyp.append(token)
+
+        for weights in (None, Levenshtein.wordAlignWeights):
+            alignment = Levenshtein.alignAnchored(ref, hyp, weights=weights, validate=True)
+            self.assertEqual(alignment.s1_string(), ' '.join(ref))
+            self.assertEqual(alignment.s2_string(), ' '.join(hyp))
+            self.assertEqual(alignment.cost, alignment.full_cost)
+            expanded = Levenshtein.expandedAlign(ref, hyp, mode=AlignMode.Anchored, weights=weights)
+            self.assertEqual(expanded.align, alignment.align)
+
+    def test_anchored_divergence(self):
+        # The unique "x" pulls the alignment away from the cheaper one
+        ref = "x a a a a".split()
+        hyp = "a a a a x".split()
+        alignment = Levenshtein.alignAnchored(ref, hyp, base_cells=0, validate=True)
+        self.assertEqual(alignment.align, ['I'] * 4 + ['C'] + ['D'] * 4)
+        self.assertEqual(alignment.cost, 8)
+        self.assertEqual(alignment.full_cost, 2)
+
+    def test_anchored_random(self):
+        for ref, hyp in random_pairs(200, word_vocab, max_len=20, seed=15):
+            alignment = Levenshtein.alignAnchored(ref, hyp, base_cells=0, validate=True)
+            if not ref and not hyp:
+                self.assertIsNone(alignment)
+                continue
+            self.assertEqual(alignment.s1_string(), ' '.join(ref))
+            self.assertEqual(alignment.s2_string(), ' '.join(hyp))
+            self.assertGreaterEqual(alignment.cost, alignment.full_cost)
+
+class LevenshteinCounts_Test(unittest.TestCase):
+
+    def assertSameCounts(self, ref, hyp, **kwargs):
+        if not ref:
+            # error_rate() has no reference length to divide by
+            return
+        expected = Levenshtein.expandedAlign(ref, hyp, **kwargs).error_rate()
+        self.assertEqual(Levenshtein.alignCounts(ref, hyp, **kwargs), expected)
+
+    def test_counts_words(self):
+        for ref, hyp in random_pairs(200, word_vocab, max_len=20, seed=8):
+            self.assertSameCounts(ref, hyp)
+            self.assertSameCounts(ref, hyp, lowercase=True, weights=Levenshtein.wordAlignWeights)
+            self.assertSameCounts(ref, hyp, weights={'C': 1, 'S': 2, 'D': 1, 'I': 3})
+
+    def test_counts_phones(self):
+        for ref, hyp in random_pairs(200, phone_vocab, max_len=20, seed=9):
+            self.assertSameCounts(ref, hyp, weights=Levenshtein.wordAlignWeights,
+                                  reserve_list=PowerAligner.reserve_list, exclusive_sets=PowerAligner.exclusive_sets)
+
+    def test_counts_no_reference(self):
+        self.assertEqual(Levenshtein.alignCounts([], ['a', 'b']), (1.0, {'C': 0, 'S': 0, 'D': 0, 'I': 2, 'L': 0}))
+
+class LevenshteinDistance_Test(unittest.TestCase):
+
+    def test_distance_words(self):
+        for ref, hyp in random_pairs(300, word_vocab, max_len=20, seed=10):
+            self.assertEqual(Levenshtein.distance(ref, hyp), Levenshtein.align(ref, hyp).dist)
+            self.assertEqual(Levenshtein.distance(ref, hyp, lowercase=True),
+                             Levenshtein.align(ref, hyp, lowercase=True).dist)
+
+    def test_distance_long(self):
+        # Spans several machine words of bits
+        for ref, hyp in random_pairs(20, word_vocab[:3], max_len=200, seed=11):
+            self.assertEqual(Levenshtein.distance(ref, hyp), Levenshtein.align(ref, hyp).dist)
+
+    def test_distance_characters(self):
+        self.assertEqual(Levenshtein.distance("kitten", "sitting"), 3)
+        self.assertEqual(Levenshtein.distance("", "abc"), 3)
+        self.assertEqual(Levenshtein.distance("abc", "abc"), 0)
+
+class AlignmentView_Test(unittest.TestCase):
+
+    def copied(self, alignment, i, j, preserve_index=False):
+        # What subsequence returned before views: copies, with the maps passed through the constructor
+        scale = 0 if preserve_index else i
+        s1_map = [k - scale for k in alignment.s1_map if i <= k < j]
+        s2_map = [k - scale for k in alignment.s2_map if i <= k < j]
+        return ExpandedAlignment(alignment.s1[i:j], alignment.s2[i:j], alignment.align[i:j], s1_map, s2_map)
+
+    def assertSameAlignment(self, actual, expected):
+        self.assertEqual(actual.s1, expected.s1)
+        self.assertEqual(actual.s2, expected.s2)
+        self.assertEqual(actual.align, expected.align)
+        self.assertEqual(actual.s1_map, expected.s1_map)
+        self.assertEqual(actual.s2_map, expected.s2_map)
+        self.assertEqual(str(actual), str(expected))
+        self.assertEqual(actual.confusion_pairs(), expected.confusion_pairs())
+
+    def test_view_matches_copy(self):
+        for ref, hyp in random_pairs(100, word_vocab, seed=4):
+            if not ref and not hyp:
+                continue
+            alignment = Levenshtein.expandedAlign(ref, hyp)
+            n = alignment.length()
+            for i in range(n):
+                for j in range(i + 1, n + 2):
+                    for preserve_index in (False, True):
+                        view = alignment.subsequence(i, j, preserve_index)
+                        self.assertIsInstance(view, AlignmentView)
+                        self.assertSameAlignment(view, self.copied(alignment, i, j, preserve_index))
+            with self.assertRaises(Exception):
+                alignment.subsequence(n, n + 1)
+
+    def test_nested_views(self):
+        alignment = Levenshtein.expandedAlign("a b c d e f g".split(), "a x c e f y g z".split())
+        outer = alignment.subsequence(1, 7)
+        inner = outer.subsequence(2, 5)
+        self.assertIs(inner.s1.base, alignment.s1)
+        self.assertSameAlignment(inner, self.copied(self.copied(alignment, 1, 7), 2, 5))
+        self.assertEqual(inner.s1[1:], outer.s1[3:5])
+        self.assertEqual(list(inner.align), inner.align[:])
+
+    def test_materialize_on_change(self):
+        alignment = Levenshtein.expandedAlign("a b c d".split(), "a x c".split())
+        expected = copy.deepcopy(alignment)
+        view = alignment.subsequence(1, 3)
+        view.s2[0] = 'y'
+        self.assertEqual(view.s2, ['y', 'c'])
+        self.assertEqual(alignment.s2, expected.s2)
+
+        view = alignment.subsequence(0, 2)
+        view.append_alignment(alignment.subsequence(2, 4))
+        self.assertSameAlignment(view, expected)
+        self.assertIsInstance(view.s1, list)
+        self.assertEqual(alignment.s1, expected.s1)
+
+    def test_copies_are_plain(self):
+        alignment = Levenshtein.expandedAlign("a b c d".split(), "a x c".split())
+        view = alignment.subsequence(1, 4)
+        for copied in (copy.deepcopy(view), pickle.loads(pickle.dumps(view))):
+            self.assertIs(type(copied), ExpandedAlignment)
+            self.assertSameAlignment(copied, view)
+            copied.s1[0] = 'z'
+            self.assertEqual(alignment.s1[1], 'b')
+
+    def test_split_error_regions(self):
+        for ref, hyp in random_pairs(100, word_vocab, seed=6):
+            if not ref and not hyp:
+                continue
+            alignment = Levenshtein.expandedAlign(ref, hyp)
+            regions, error_indexes = alignment.split_error_regions()
+            merged = regions[0].materialize()
+            for region in regions[1:]:
+                merged.append_alignment(region)
+            self.assertEqual(merged.align, alignment.align)
+            self.assertEqual(merged.s1_string(), alignment.s1_string())
+            self.assertEqual(merged.s2_string(), alignment.s2_string())
+
+class CompactAlignment_Test(unittest.TestCase):
+
+    def assertSameMethods(self, compact, alignment):
+        self.assertEqual(compact.s1, alignment.s1)
+        self.assertEqual(compact.s2, alignment.s2)
+        self.assertEqual(compact.align, alignment.align)
+        self.assertEqual(compact.s1_tokens(), alignment.s1_tokens())
+        self.assertEqual(compact.s2_string(), alignment.s2_string())
+        self.assertEqual(compact.error_rate(), alignment.error_rate())
+        self.assertEqual(compact.error_rate(cluster_on_ref=True), alignment.error_rate(cluster_on_ref=True))
+        self.assertEqual(compact.confusion_pairs(), alignment.confusion_pairs())
+        self.assertEqual(compact.hyp_oriented_alignment(), alignment.hyp_oriented_alignment())
+        self.assertEqual(str(compact), str(alignment))
+        self.assertEqual(compact.to_dict(), alignment.to_dict())
+        self.assertEqual(compact.expand().to_dict(), alignment.to_dict())
+
+    def test_compact_words(self):
+        vocabulary = Vocabulary()
+        for ref, hyp in random_pairs(100, word_vocab, seed=8):
+            if not ref:
+                continue
+            alignment = Levenshtein.expandedAlign(ref, hyp, lowercase=True)
+            compact = alignment.compact(vocabulary)
+            self.assertSameMethods(compact, alignment)
+            self.assertFalse(hasattr(compact, '__dict__'))
+        # Every distinct entry is stored once
+        self.assertEqual(len(vocabulary), len(set(word_vocab)) + 1)
+
+    def test_compact_power(self):
+        aligner = PowerAligner("with a Dr. Brown in Stanford", "with the doctor brahmin stanford", lowercase=True,
+                               lexicon="lex/cmudict.rep.json")
+        aligner.align()
+        vocabulary = Vocabulary()
+        for alignment in (aligner.wer_alignment, aligner.power_alignment):
+            compact = CompactAlignment.from_alignment(alignment, vocabulary)
+            self.assertSameMethods(compact, alignment)
+            self.assertEqual(compact.labels, ''.join(alignment.align).encode('ascii'))
+            self.assertEqual(compact.s1_ids.typecode, 'B')
+
+        copied = pickle.loads(pickle.dumps(compact))
+        self.assertSameMethods(copied, aligner.power_alignment)
+
+class SubstitutionTable_Test(unittest.TestCase):
+
+    def test_table_rules(self):
+        table = PowerAligner.phone_table
+        ids = table.internTokens(['|', '#', 'ae', 'iy', 'er', 'r', 'k', 't'])
+        pipe, hash_, ae, iy, er, r, k, t = ids
+        self.assertTrue(table.maySubstitute(ae, iy))
+        self.assertTrue(table.maySubstitute(k, t))
+        self.assertTrue(table.maySubstitute(er, r))
+        self.assertTrue(table.maySubstitute(er, ae))
+        self.assertFalse(table.maySubstitute(ae, k))
+        self.assertFalse(table.maySubstitute(pipe, hash_))
+        self.assertFalse(table.maySubstitute(pipe, ae))
+
+    def test_table_interns_unseen(self):
+        table = SubstitutionTable(set(['|']), [set(['a', 'b'])], ['a'])
+        x, y, b = table.internTokens(['x', 'y', 'b'])
+        self.assertEqual(table.internTokens(['a', 'x']), [0, x])
+        self.assertTrue(table.maySubstitute(x, y))
+        self.assertFalse(table.maySubstitute(x, b))
+        self.assertTrue(SubstitutionTable().maySubstitute(0, 1))
+
+    def test_shared_table_alignments(self):
+        table = SubstitutionTable(PowerAligner.reserve_list, PowerAligner.exclusive_sets)
+        for ref, hyp in random_pairs(150, phone_vocab, seed=9):
+            expected = Levenshtein.align(ref, hyp, weights=Levenshtein.wordAlignWeights,
+                                         reserve_list=PowerAligner.reserve_list, exclusive_sets=PowerAligner.exclusive_sets)
+            for engine in (AlignEngine.Python, AlignEngine.NumPy):
+                actual = Levenshtein.align(ref, hyp, weights=Levenshtein.wordAlignWeights, engine=engine,
+                                           substitution_table=table)
+                self.assertEqual(actual.dist, expected.dist)
+                self.assertEqual(actual.editops(), expected.editops())
+            actual = Levenshtein.alignBanded(ref, hyp, weights=Levenshtein.wordAlignWeights, substitution_table=table)
+            self.assertEqual(actual.editops(), expected.editops())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from power.lexicon import CompiledLexicon, SortedKeyIndex, compile_lexicon, is_compiled_lexicon, load_lexicon
+from power.pronounce import PronouncerLex
+
+class Lexicon_Test(unittest.TestCase):
+
+    lex = "lex/cmudict.rep.json"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_compiled_lookup(self):
+        lexicon = {"cat": "k ae t", "at": "ae t", "café": "k ae # f ey", "a": "ax"}
+        filepath = os.path.join(self.tmpdir, "small.bin")
+        compile_lexicon(lexicon, filepath)
+        self.assertTrue(is_compiled_lexicon(filepath))
+
+        compiled = CompiledLexicon(filepath)
+        self.assertEqual(len(compiled), 4)
+        for key, value in lexicon.items():
+            self.assertIn(key, compiled)
+            self.assertEqual(compiled[key], value)
+        self.assertNotIn("ca", compiled)
+        self.assertNotIn("dog", compiled)
+        self.assertIsNone(compiled.get("dog"))
+        self.assertRaises(KeyError, lambda: compiled["dog"])
+        self.assertEqual(list(compiled), ["a", "at", "café", "cat"])
+        compiled.close()
+
+    def test_compiled_empty(self):
+        filepath = os.path.join(self.tmpdir, "empty.bin")
+        compile_lexicon({}, filepath)
+        compiled = load_lexicon(filepath)
+        self.assertEqual(len(compiled), 0)
+        self.assertNotIn("a", compiled)
+
+    def test_load_json(self):
+        self.assertFalse(is_compiled_lexicon(self.lex))
+        self.assertIsInstance(load_lexicon(self.lex), dict)
+
+    def test_longest_prefix(self):
+        lexicon = {"cat": "k ae t", "cats": "k ae t s", "at": "ae t", "café": "k ae # f ey", "a": "ax", "z\U0010ffff": "z"}
+        filepath = os.path.join(self.tmpdir, "small.bin")
+        compile_lexicon(lexicon, filepath)
+        for index in (SortedKeyIndex(lexicon), CompiledLexicon(filepath)):
+            self.assertEqual(index.longest_prefix("catsup"), (4, "k ae t s"))
+            self.assertEqual(index.longest_prefix("catsup", 1), (3, "ae t"))
+            self.assertEqual(index.longest_prefix("cab", 1), (2, "ax"))
+            self.assertEqual(index.longest_prefix("catsup", 4), None)
+            self.assertEqual(index.longest_prefix("cafés", 0), (4, "k ae # f ey"))
+            self.assertEqual(index.longest_prefix("caf", 0), None)
+            self.assertEqual(index.longest_prefix("z\U0010ffffz", 0), (2, "z"))
+            self.assertEqual(index.longest_prefix("", 0), None)
+
+    def test_pronouncer_compiled(self):
+        lexicon = load_lexicon(self.lex)
+        filepath = os.path.join(self.tmpdir, "cmudict.rep.bin")
+        compile_lexicon(lexicon, filepath)
+
+        words = "an antiserum an injection of rabid antibodies 50-year-old brahmin xyzzy schmorgasbordly".split()
+        expected = PronouncerLex(self.lex).pronounce(words)
+        actual = PronouncerLex(filepath).pronounce(words)
+        self.assertEqual(actual, expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import io
+import random
+import unittest
+from power.levenshtein import AlignMode, Levenshtein
+from power.nbest import NbestScorer, errors, prefix_costs, prefix_counts, read_nbest, read_nbest_segments
+from power.pipeline import SegmentScorer
+
+class Nbest_Test(unittest.TestCase):
+
+    lex = "lex/cmudict.rep.json"
+
+    def test_prefix_costs_match_align(self):
+        rng = random.Random(3)
+        vocab = ["a", "b", "c", "d", "e"]
+        for weights in (None, Levenshtein.wordAlignWeights):
+            for _ in range(20):
+                ref = [rng.choice(vocab) for _ in range(rng.randint(0, 8))]
+                stem = [rng.choice(vocab) for _ in range(rng.randint(0, 6))]
+                hyps = [stem + [rng.choice(vocab) for _ in range(rng.randint(0, 4))] for _ in range(10)]
+                costs, rows = prefix_costs(ref, hyps, weights)
+                for hyp, cost in zip(hyps, costs):
+                    self.assertEqual(cost, Levenshtein.align(ref, hyp, weights=weights).dist)
+                self.assertLessEqual(rows, sum(len(hyp) for hyp in hyps))
+
+    def test_shared_prefix_rows(self):
+        costs, rows = prefix_costs("the cat sat".split(), ["the cat sat".split(), "the cat".split(), "the dog sat".split()])
+        self.assertEqual(costs, [0, 1, 1])
+        # "the", "cat", "sat", then "dog", "sat" after the shared "the"
+        self.assertEqual(rows, 5)
+
+    def test_read_nbest(self):
+        nbest = io.StringIO("0 ||| the cat ||| f=1 ||| -1\n0 ||| a cat ||| f=2 ||| -2\n2 ||| dog ||| f=1 ||| -1\n")
+        self.assertEqual(list(read_nbest(nbest)), [(0, ["the cat", "a cat"]), (2, ["dog"])])
+
+        nbest.seek(0)
+        refs = io.StringIO("the cat\nthe bird\nthe dog\n")
+        self.assertEqual(list(read_nbest_segments(refs, nbest)),
+                         [("the cat", ("the cat", "a cat")), ("the bird", ("",)), ("the dog", ("dog",))])
+
+        with self.assertRaises(ValueError):
+            list(read_nbest(io.StringIO("not an n-best line\n")))
+
+    def test_oracle(self):
+        scorer = NbestScorer(self.lex, lowercase=True)
+        result = scorer.score("the cat sat on the mat", ("a cat sat on a mat", "the cat sat on the mat", "the cat"))
+        self.assertEqual(result.nbest.wer_rank, 1)
+        self.assertEqual(result.nbest.power_rank, 1)
+        self.assertEqual(result.wer_components['C'], 6)
+        self.assertEqual(result.power_alignment.align, ['C'] * 6)
+
+        # More candidates can only lower the oracle errors
+        hyps = ("the cat sad on them at", "a cat sat on the", "the cats at on the mat")
+        best = NbestScorer(self.lex, lowercase=True, candidates=1).score("the cat sat on the mat", hyps)
+        oracle = NbestScorer(self.lex, lowercase=True, candidates=3).score("the cat sat on the mat", hyps)
+        self.assertLessEqual(errors(oracle.power_components), errors(best.power_components))
+        self.assertLessEqual(errors(oracle.wer_components), errors(best.wer_components))
+
+    def test_oracle_is_fewest_errors(self):
+        # The entry with the lowest word alignment cost (5 deletions) isn't the one with the fewest errors (4 substitutions)
+        hyps = ("v w x y e f", "f")
+        oracle = NbestScorer(self.lex).score("a b c d e f", hyps)
+        self.assertEqual(oracle.nbest.wer_rank, 0)
+        self.assertEqual(oracle.nbest.wer_hyp, "v w x y e f")
+        self.assertEqual(errors(oracle.wer_components), 4)
+
+        # With one candidate, only the entry with the lowest bound is aligned for POWER
+        approximate = NbestScorer(self.lex, candidates=1).score("a b c d e f", hyps)
+        self.assertEqual(approximate.nbest.wer_rank, 0)
+        self.assertEqual(approximate.nbest.power_rank, 0)
+        self.assertEqual(approximate.nbest.aligned, 1)
+
+    def test_prefix_counts_match_wer(self):
+        rng = random.Random(5)
+        vocab = ["a", "b", "c", "d", "e"]
+        for weights in (None, Levenshtein.wordAlignWeights):
+            for _ in range(20):
+                ref = [rng.choice(vocab) for _ in range(rng.randint(1, 8))]
+                hyps = [[rng.choice(vocab) for _ in range(rng.randint(0, 8))] for _ in range(8)]
+                costs, counts, rows = prefix_counts(ref, hyps, weights)
+                self.assertEqual(costs, prefix_costs(ref, hyps, weights)[0])
+                for hyp, hyp_counts in zip(hyps, counts):
+                    _, components = Levenshtein.alignCounts(ref, hyp, weights=weights)
+                    self.assertEqual(hyp_counts, tuple(components[x] for x in "CSDI"))
+                    if weights and hyp:
+                        # The counts of the WER alignment, as PowerAligner computes it
+                        _, wer = Levenshtein.expandedAlign(ref, hyp, weights=weights).error_rate()
+                        self.assertEqual(hyp_counts, tuple(wer[x] for x in "CSDI"))
+
+    def test_oracle_matches_every_entry(self):
+        rng = random.Random(7)
+        vocab = "the cat sat on a mat at dog sad them cats".split()
+        scorer = SegmentScorer(self.lex, lowercase=True)
+        for mode in (AlignMode.Full, AlignMode.Anchored):
+            nbest = NbestScorer(self.lex, lowercase=True, word_align_mode=mode)
+            aligned = 0
+            for _ in range(15):
+                ref = ' '.join(rng.choice(vocab) for _ in range(rng.randint(1, 7)))
+                hyps = tuple(' '.join(rng.choice(vocab) for _ in range(rng.randint(1, 7))) for _ in range(6))
+                every = [SegmentScorer.score(nbest, ref, hyp) for hyp in hyps]
+                oracle = nbest.score(ref, hyps)
+                wer = min(range(len(hyps)), key=lambda k: (errors(every[k].wer_components), k))
+                power = min(range(len(hyps)), key=lambda k: (errors(every[k].power_components), k))
+                self.assertEqual((oracle.nbest.wer_rank, oracle.nbest.power_rank), (wer, power))
+                self.assertEqual(oracle.power_components, every[power].power_components)
+                self.assertEqual(oracle.wer_components, every[wer].wer_components)
+                aligned += oracle.nbest.aligned
+            # The bound spares some of the full alignments
+            self.assertLess(aligned, 15 * 6)
+
+if __name__ == "__main__":
+    unittest.main()
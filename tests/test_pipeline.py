@@ -0,0 +1,291 @@
+import itertools
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from power.levenshtein import AlignMode
+from power.pipeline import (SegmentScorer, SystemsScorer, ScoredSegment, ScoreTotals, PreviousRun, prefetch, read_segments,
+                            read_systems, score_segments)
+
+class Pipeline_Test(unittest.TestCase):
+
+    lex = "lex/cmudict.rep.json"
+    ref = "examples/align-words/ref.txt"
+    hyp = "examples/align-words/hyp.txt"
+
+    def score(self, jobs):
+        scorer = SegmentScorer(self.lex, lowercase=True)
+        with open(self.ref, 'r') as f_ref, open(self.hyp, 'r') as f_hyp:
+            return list(score_segments(read_segments(f_ref, f_hyp), scorer, jobs=jobs))
+
+    def test_parallel_matches_serial(self):
+        expected = self.score(1)
+        actual = self.score(2)
+        self.assertEqual(len(actual), len(expected))
+        for (segment, aligner), (expected_segment, expected_aligner) in zip(actual, expected):
+            self.assertEqual(segment, expected_segment)
+            self.assertIsNone(aligner.pronouncer)
+            self.assertEqual(aligner.wer_components, expected_aligner.wer_components)
+            self.assertEqual(aligner.power_components, expected_aligner.power_components)
+            self.assertEqual(aligner.power_alignment.align, expected_aligner.power_alignment.align)
+            self.assertEqual(aligner.power_alignment.s1, expected_aligner.power_alignment.s1)
+            self.assertEqual(aligner.power_alignment.s2, expected_aligner.power_alignment.s2)
+
+    def test_blank_segment(self):
+        scorer = SegmentScorer(self.lex)
+        segments = [("the cat sat", "a cat sat"), ("", ""), ("the dog", "the dog")]
+        results = list(score_segments(iter(segments), scorer))
+        self.assertEqual([segment for segment, _ in results], segments)
+        self.assertIsNone(results[1][1])
+        self.assertEqual(results[0][1].power_alignment.align, ['S', 'C', 'C'])
+
+    def test_prefetch(self):
+        self.assertEqual(list(prefetch(iter(range(100)), size=4)), list(range(100)))
+
+        def failing():
+            yield 1
+            raise ValueError("read error")
+        stream = prefetch(failing())
+        self.assertEqual(next(stream), 1)
+        self.assertRaises(ValueError, next, stream)
+
+    def test_prefetch_stops_early(self):
+        closed = threading.Event()
+        def endless():
+            try:
+                for i in itertools.count():
+                    yield i
+            finally:
+                closed.set()
+        stream = prefetch(endless(), size=2)
+        self.assertEqual(next(stream), 0)
+        # The reader thread is blocked on a full buffer until the consumer goes away
+        stream.close()
+        self.assertTrue(closed.wait(5))
+
+    def test_window_bounds_reading(self):
+        consumed = []
+        def segments():
+            for i in range(200):
+                consumed.append(i)
+                yield ("the cat sat {0}".format(i), "a cat sat {0}".format(i))
+
+        scorer = SegmentScorer(self.lex)
+        results = score_segments(segments(), scorer, jobs=2, chunksize=4, window=3)
+        segment, aligner = next(results)
+        self.assertEqual(segment, ("the cat sat 0", "a cat sat 0"))
+        # At most window batches are in flight, plus the batch being submitted.
+        self.assertLessEqual(len(consumed), 4 * 4)
+        self.assertEqual(len(list(results)), 199)
+        self.assertEqual(len(consumed), 200)
+
+    def test_totals(self):
+        totals = ScoreTotals(confusions=True, wer_confusions=True)
+        aligners = [aligner for _, aligner in self.score(2) if aligner is not None]
+        for aligner in aligners:
+            totals.add(aligner)
+        self.assertEqual(totals.power_components['L'], sum(a.power_components['L'] for a in aligners))
+        self.assertEqual(totals.wer_components['S'], sum(a.wer_components['S'] for a in aligners))
+        self.assertEqual(totals.power_confusions['learning'], {'loaning': 1})
+
+    def assertSameResults(self, actual, expected):
+        self.assertEqual(actual.wer_components, expected.wer_components)
+        self.assertEqual(actual.power_components, expected.power_components)
+        self.assertEqual(actual.error_indexes, expected.error_indexes)
+        for field in ('wer_alignment', 'power_alignment'):
+            a, e = getattr(actual, field), getattr(expected, field)
+            self.assertEqual((a.s1, a.s2, a.align, a.s1_map, a.s2_map), (e.s1, e.s2, e.align, e.s1_map, e.s2_map))
+        for a, e in zip(actual.split_regions, expected.split_regions):
+            self.assertEqual((a.s1, a.s2, a.align), (e.s1, e.s2, e.align))
+        self.assertEqual([str(x) for x in actual.phonetic_alignments], [str(x) for x in expected.phonetic_alignments])
+
+    def test_result_cache(self):
+        with open(self.ref, 'r') as f_ref, open(self.hyp, 'r') as f_hyp:
+            segments = [x for x in read_segments(f_ref, f_hyp) if x[0]]
+        # The same segments again, with other casing: cached results must take the casing of the new segment.
+        segments += [(ref.upper(), hyp.title()) for ref, hyp in segments]
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            result_cache = os.path.join(tmpdir, "results.db")
+            uncached = SegmentScorer(self.lex, lowercase=True, cache_size=0)
+            cached = SegmentScorer(self.lex, lowercase=True, result_cache=result_cache)
+            for ref, hyp in segments:
+                self.assertSameResults(cached.score(ref, hyp), uncached.score(ref, hyp))
+            memory, disk = cached.caches()
+            self.assertEqual(memory.hits, len(segments) // 2)
+            self.assertEqual(len(disk), len(segments) // 2)
+
+            # A new process starts with an empty memory tier, and reads the results from disk.
+            warm = SegmentScorer(self.lex, lowercase=True, result_cache=result_cache)
+            for ref, hyp in segments:
+                result = warm.score(ref, hyp)
+                self.assertIsInstance(result, ScoredSegment)
+                self.assertSameResults(result, uncached.score(ref, hyp))
+            self.assertEqual(warm.caches()[1].hits, len(segments) // 2)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_result_cache_hits_are_copies(self):
+        ref, hyp = "with a Dr. Brown in Stanford", "with the doctor brahmin stanford"
+        expected = SegmentScorer(self.lex, lowercase=True, cache_size=0).score(ref, hyp)
+        scorer = SegmentScorer(self.lex, lowercase=True)
+        scorer.score(ref, hyp)
+        for _ in range(2):
+            # Changing the results of a hit must not change the cached results
+            hit = scorer.score(ref, hyp)
+            self.assertIsInstance(hit, ScoredSegment)
+            self.assertSameResults(hit, expected)
+            hit.power_alignment.align[0] = 'X'
+            hit.power_alignment.s1[0] = 'changed'
+            hit.power_alignment.s1_map.append(99)
+            hit.wer_alignment.align[0] = 'X'
+            hit.split_regions[0].s2[0] = 'changed'
+            hit.error_indexes.append(99)
+        self.assertEqual(scorer.caches()[0].hits, 2)
+
+    def test_result_cache_key(self):
+        scorer = SegmentScorer(self.lex, lowercase=True)
+        self.assertEqual(scorer.cache_key(["The", "cat"], ["a"]), scorer.cache_key(["the", "CAT"], ["A"]))
+        weighted = SegmentScorer(self.lex, lowercase=True, word_align_weights={'C': 0, 'S': 1, 'D': 1, 'I': 1})
+        self.assertNotEqual(scorer.cache_key(["the"], ["a"]), weighted.cache_key(["the"], ["a"]))
+        sensitive = SegmentScorer(self.lex)
+        self.assertNotEqual(sensitive.cache_key(["The"], ["a"]), sensitive.cache_key(["the"], ["a"]))
+
+    def test_result_cache_modes(self):
+        # Anchored alignment is a heuristic: its results must not be served to a full alignment of the same segment
+        ref = ' '.join(["x"] + ["the"] * 70)
+        hyp = ' '.join(["the"] * 70 + ["x"])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            result_cache = os.path.join(tmpdir, "results.db")
+            anchored = SegmentScorer(self.lex, lowercase=True, result_cache=result_cache,
+                                     word_align_mode=AlignMode.Anchored).score(ref, hyp)
+            full = SegmentScorer(self.lex, lowercase=True, result_cache=result_cache).score(ref, hyp)
+            expected = SegmentScorer(self.lex, lowercase=True, cache_size=0).score(ref, hyp)
+            self.assertNotEqual(anchored.wer_components, expected.wer_components)
+            self.assertSameResults(full, expected)
+        finally:
+            shutil.rmtree(tmpdir)
+
+class PowerScript(object):
+    '''Runs power.py on the example corpus with a blank segment added, and a second hyp file with some changes.'''
+
+    lex = "lex/cmudict.rep.json"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with open("examples/align-words/ref.txt", 'r') as f:
+            refs = [x.strip() for x in f]
+        with open("examples/align-words/hyp.txt", 'r') as f:
+            hyps = [x.strip() for x in f]
+        # A blank segment, which has no line in the WER json output
+        refs.insert(3, "")
+        hyps.insert(3, "")
+        self.ref = self.write("ref.txt", refs)
+        self.hyp = self.write("hyp.txt", hyps)
+        hyps[1] = "a completely different hypothesis"
+        hyps[6] = hyps[6].upper()
+        self.hyp2 = self.write("hyp2.txt", hyps)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, lines):
+        filepath = os.path.join(self.tmpdir, name)
+        with open(filepath, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return filepath
+
+    def power(self, output, hyp, *args):
+        hyps = hyp if isinstance(hyp, list) else [hyp]
+        return subprocess.run([sys.executable, "power.py", "--ref", self.ref, "--hyp"] + hyps + ["--lexicon", self.lex,
+                        "--output", os.path.join(self.tmpdir, output), "-f", "json", "snt", "--print-wer",
+                        "--show-confusions", "txt"] + list(args),
+                              stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+
+    def read(self, name):
+        with open(os.path.join(self.tmpdir, name), 'r') as f:
+            return f.read()
+
+class PreviousRun_Test(PowerScript, unittest.TestCase):
+
+    def test_incremental_matches_full(self):
+        self.power("prev", self.hyp)
+        self.power("full", self.hyp2)
+        self.power("inc", self.hyp2, "--previous", os.path.join(self.tmpdir, "prev"), "--previous-hyp", self.hyp)
+        for suffix in ("power.json", "wer.json", "power.snt", "wer.snt", "power.conf", "wer.conf"):
+            self.assertEqual(self.read("inc." + suffix), self.read("full." + suffix), suffix)
+
+    def test_options_mismatch(self):
+        self.power("prev", self.hyp)
+        options = ["--case-sensitive", "--word-align-weights", "0", "2", "1", "1"]
+        self.power("full", self.hyp2, *options)
+        stdout = self.power("inc", self.hyp2, "--previous", os.path.join(self.tmpdir, "prev"),
+                            "--previous-hyp", self.hyp, *options)
+        self.assertIn("options differ: lowercase, word_align_weights", stdout)
+        self.assertIn("Reused 0 of", stdout)
+        for suffix in ("power.json", "wer.json", "power.snt", "wer.snt"):
+            self.assertEqual(self.read("inc." + suffix), self.read("full." + suffix), suffix)
+
+        # Output without the options of its run is not reused either
+        os.remove(os.path.join(self.tmpdir, "prev.options.json"))
+        scorer = SegmentScorer(self.lex, lowercase=True)
+        previous = PreviousRun(os.path.join(self.tmpdir, "prev"), self.ref, self.hyp, lowercase=True,
+                               options=scorer.options())
+        self.assertIn("missing", previous.reason)
+        self.assertIsNone(previous(("x", "y")))
+        previous.close()
+
+    def test_reuse(self):
+        self.power("prev", self.hyp)
+        previous = PreviousRun(os.path.join(self.tmpdir, "prev"), self.ref, self.hyp, lowercase=True)
+        scorer = SegmentScorer(self.lex, lowercase=True, cache_size=0)
+        with open(self.ref, 'r') as f_ref, open(self.hyp2, 'r') as f_hyp:
+            results = list(score_segments(read_segments(f_ref, f_hyp), scorer, reuse=previous))
+        previous.close()
+        self.assertEqual(previous.reused, len(results) - 3)
+        self.assertIsNone(results[3][1])
+        self.assertNotIsInstance(results[1][1], ScoredSegment)
+        self.assertIsInstance(results[0][1], ScoredSegment)
+        self.assertNotIsInstance(results[6][1], ScoredSegment)
+
+class Systems_Test(PowerScript, unittest.TestCase):
+
+    def test_systems_match_single_runs(self):
+        stdout = self.power("multi", [self.hyp, self.hyp2, self.hyp], "-j", "2", "--compare")
+        self.power("hyp", self.hyp)
+        self.power("hyp2", self.hyp2)
+        # Systems with the same file name are told apart by their position
+        for system, single in (("hyp1", "hyp"), ("hyp2", "hyp2"), ("hyp3", "hyp")):
+            for suffix in ("power.json", "wer.json", "power.snt", "wer.snt", "power.conf", "wer.conf"):
+                self.assertEqual(self.read("multi.{0}.{1}".format(system, suffix)), self.read("{0}.{1}".format(single, suffix)),
+                                 suffix)
+            self.assertTrue(os.path.exists(os.path.join(self.tmpdir, "multi.{0}.rsum".format(system))))
+
+        table = self.read("multi.systems.txt")
+        self.assertIn(table, stdout)
+        rows = [line.split()[0] for line in table.splitlines()[4:]]
+        self.assertEqual(rows, ["hyp1", "hyp2", "hyp3"])
+
+    def test_systems_scorer(self):
+        scorer = SystemsScorer(self.lex, lowercase=True)
+        single = SegmentScorer(self.lex, lowercase=True)
+        with open(self.ref, 'r') as f_ref, open(self.hyp, 'r') as f_hyp, open(self.hyp2, 'r') as f_hyp2:
+            results = list(score_segments(read_systems(f_ref, [f_hyp, f_hyp2]), scorer, jobs=2))
+        for (refline, hyplines), aligners in results:
+            self.assertEqual(len(aligners), 2)
+            for hypline, aligner in zip(hyplines, aligners):
+                expected = single.score(refline, hypline)
+                if expected is None:
+                    self.assertIsNone(aligner)
+                    continue
+                self.assertIsNone(aligner.pronouncer)
+                self.assertEqual(aligner.power_components, expected.power_components)
+                self.assertEqual(aligner.power_alignment.align, expected.power_alignment.align)
+
+if __name__ == "__main__":
+    unittest.main()
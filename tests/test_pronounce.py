@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+from power.aligner import PowerAligner
+from power.pronounce import PronouncerLex, PronouncerBase, PronouncerType, get_pronouncer
+
+class Pronounce_Test(unittest.TestCase):
+
+    lex = "lex/cmudict.rep.json"
+
+    def test_get_pronouncer_shared(self):
+        pronouncer = get_pronouncer(self.lex)
+        self.assertIsInstance(pronouncer, PronouncerLex)
+        self.assertIs(pronouncer, get_pronouncer(self.lex))
+        self.assertIs(pronouncer, get_pronouncer("./" + self.lex))
+
+    def test_get_pronouncer_base(self):
+        pronouncer = get_pronouncer(pronounce_type=PronouncerType.Base)
+        self.assertIsInstance(pronouncer, PronouncerBase)
+
+    def test_aligner_shares_pronouncer(self):
+        a = PowerAligner("the cat sat", "a cat sat", lexicon=self.lex)
+        b = PowerAligner("the dog ran", "the dog man", lexicon=self.lex)
+        self.assertIs(a.pronouncer, b.pronouncer)
+
+    def test_aligner_given_pronouncer(self):
+        pronouncer = get_pronouncer(self.lex)
+        aligner = PowerAligner("the cat sat", "a cat sat", pronouncer=pronouncer)
+        aligner.align()
+        self.assertIs(aligner.pronouncer, pronouncer)
+        self.assertEqual(aligner.power_alignment.align, ['S', 'C', 'C'])
+
+    def test_pronunciation_cache(self):
+        pronouncer = PronouncerLex(self.lex, cache_size=3)
+        words = "The xyzzy 50-year-old the XYZZY".split()
+        expected = [pronouncer.lexicon["the"], pronouncer.alt_pronounce("xyzzy"),
+                    pronouncer.alt_pronounce("50-year-old"), pronouncer.lexicon["the"], pronouncer.alt_pronounce("xyzzy")]
+        self.assertEqual(pronouncer.pronounce(words), "| {0} |".format(' | '.join(expected)).split())
+        self.assertEqual((pronouncer.cache.hits, pronouncer.cache.misses, pronouncer.cache.evictions), (2, 3, 0))
+
+        pronouncer.pronounce(["cat"])
+        self.assertEqual(pronouncer.cache.evictions, 1)
+        self.assertNotIn("50-year-old", pronouncer.cache)
+        self.assertIn("the", pronouncer.cache)
+
+    def test_oov_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            oov_cache = os.path.join(tmpdir, "oov.db")
+            words = "the xyzzy 50-year-old".split()
+            expected = PronouncerLex(self.lex).pronounce(words)
+
+            cold = PronouncerLex(self.lex, oov_cache=oov_cache)
+            self.assertEqual(cold.pronounce(words), expected)
+            self.assertEqual(len(cold.oov_cache), 2)
+
+            warm = PronouncerLex(self.lex, oov_cache=oov_cache)
+            def no_fallback(word):
+                raise AssertionError("fallback G2P for {0}".format(word))
+            warm.alt_pronounce = no_fallback
+            self.assertEqual(warm.pronounce(words), expected)
+            self.assertEqual(warm.oov_cache.hits, 2)
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()